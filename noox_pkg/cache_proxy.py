@@ -0,0 +1,402 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from .daemon import is_loopback
+from .utils import downloader, membudget
+
+DEFAULT_HOST = "127.0.0.1" # Serving the LAN (--host 0.0.0.0) requires --allow-host
+DEFAULT_PORT = 8766
+DEFAULT_CACHE_DIR = "noox_cache"
+DEFAULT_MAX_CACHE_BYTES = 10 * 1024 * 1024 * 1024
+INDEX_FILE = "index.json" # Maps content sha256 -> URL cache key
+SEND_CHUNK_SIZE = 64 * 1024
+# How long a request for an in-flight fetch waits for the upstream size before the
+# response is started without it (chunked), so the client's read timeout doesn't fire.
+SIZE_WAIT = 2
+CLIENT_TIMEOUT = 60 # Seconds a client may take to send a request or accept data
+
+def cache_key(urls: list[str]) -> str:
+    """
+    Cache key for a mirror list.
+
+    The whole list is part of the key: the bytes come from whichever mirror is fastest,
+    so keying on one URL would let a client that adds its own "mirror" plant content
+    under someone else's URL.
+    """
+    return hashlib.sha256("\n".join(sorted(set(urls))).encode()).hexdigest()
+
+class _Fetch:
+    """An upstream fetch in progress, shared by every request for the same URL."""
+
+    def __init__(self):
+        self.size_known = threading.Event() # Set once the upstream response headers arrive
+        self.done = threading.Event()
+        self.total_size = None
+        self.ok = False
+
+class ArtifactCache:
+    """
+    On-disk cache of downloaded artifacts, keyed by mirror list and by content hash.
+
+    Concurrent requests for the same uncached mirror list share a single upstream fetch.
+    While it runs, every requester streams from the partially written file. Once the
+    cache grows past `max_size` bytes, the least recently used artifacts are removed.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_MAX_CACHE_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.session = requests.Session()
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        self.content_index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.content_index = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Warning: Could not read cache index {self.index_path}: {e}")
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def path_for_content(self, sha256: str) -> str | None:
+        key = self.content_index.get(sha256.lower())
+        return self.path_for(key) if key else None
+
+    def lookup(self, urls: list[str]) -> tuple[str, "_Fetch | None"]:
+        """
+        Returns the file to serve for `urls` and the in-flight fetch writing it, if any.
+
+        Starts an upstream fetch when the file is neither cached nor being fetched.
+        """
+        key = cache_key(urls)
+        path = self.path_for(key)
+        with self.lock:
+            if os.path.exists(path):
+                os.utime(path) # Mark as recently used for eviction
+                return path, None
+            fetch = self.in_flight.get(key)
+            if fetch is None:
+                fetch = self.in_flight[key] = _Fetch()
+                threading.Thread(target=self._fetch_upstream, args=(urls, key, fetch), daemon=True).start()
+        return path + ".part", fetch
+
+    def _fetch_upstream(self, urls: list[str], key: str, fetch: _Fetch):
+        def progress_callback(bytes_downloaded, total_size, percentage):
+            if not fetch.size_known.is_set():
+                fetch.total_size = total_size
+                fetch.size_known.set()
+
+        print(f"Cache miss, fetching upstream: {urls[0]}")
+        fetch.ok = downloader.download_file(urls, self.cache_dir, key + ".part", progress_callback=progress_callback,
+                                            session=self.session, cache_proxy="")
+        if fetch.ok:
+            part_path = self.path_for(key) + ".part"
+            content_hash = _sha256_file(part_path)
+            os.replace(part_path, self.path_for(key))
+            with self.lock:
+                self.content_index[content_hash] = key
+                self._evict(keep=key)
+                self._save_index()
+        with self.lock:
+            del self.in_flight[key]
+        fetch.size_known.set() # Wake waiters even if the fetch failed before any response
+        fetch.done.set()
+
+    def _evict(self, keep: str):
+        # Caller must hold self.lock. Clients still reading an evicted file keep their open handle.
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = self.path_for(name)
+            if name == INDEX_FILE or name.endswith((".part", ".tmp")) or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        evicted = set()
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.path_for(name))
+            except OSError as e:
+                print(f"Warning: Could not evict {name} from the cache: {e}")
+                continue
+            total -= size
+            evicted.add(name)
+        if evicted:
+            print(f"Evicted {len(evicted)} artifacts to keep the cache under {self.max_size // (1024 * 1024)} MB")
+            self.content_index = {h: k for h, k in self.content_index.items() if k not in evicted}
+
+    def _save_index(self):
+        # Caller must hold self.lock.
+        try:
+            with open(self.index_path, 'w') as f:
+                json.dump(self.content_index, f, indent=2)
+        except OSError as e:
+            print(f"Warning: Could not write cache index {self.index_path}: {e}")
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parses a single 'bytes=start-end' Range header. Returns None if it can't be satisfied."""
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not m or m.group(1) == m.group(2) == '':
+        return None
+    if m.group(1) == '': # Suffix range: last N bytes
+        start, end = max(size - int(m.group(2)), 0), size - 1
+    else:
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start > end:
+        return None
+    return start, end
+
+class CacheProxyRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves cached artifacts over HTTP with Range support:
+
+        GET /fetch?url=<url>[&url=<mirror>...]   artifact for a URL, fetched upstream on a miss
+        GET /sha256/<hex>                        previously cached artifact by content hash
+
+    Only http(s) URLs on the server's allowed hosts are fetched, if it has a list.
+    """
+    server_version = "noox-cache-proxy"
+    protocol_version = "HTTP/1.1" # For chunked responses while the size is unknown
+    timeout = CLIENT_TIMEOUT # Drops stalled clients instead of keeping their thread forever
+
+    @property
+    def cache(self) -> ArtifactCache:
+        return self.server.cache
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/fetch":
+            urls = parse_qs(parsed.query).get("url")
+            if not urls:
+                self.send_error(400, "Missing url parameter")
+                return
+            if not all(self._allowed(url) for url in urls):
+                self.send_error(403, "Upstream host not allowed")
+                return
+            path, fetch = self.cache.lookup(urls)
+            if fetch is not None:
+                self._send_in_flight(path, fetch)
+            else:
+                self._send_file(path)
+        elif parsed.path.startswith("/sha256/"):
+            path = self.cache.path_for_content(parsed.path[len("/sha256/"):])
+            if path is None or not os.path.exists(path):
+                self.send_error(404, "Not cached")
+            else:
+                self._send_file(path)
+        else:
+            self.send_error(404, "Unknown endpoint")
+
+    def _allowed(self, url: str) -> bool:
+        parsed = urlparse(url)
+        allow_hosts = self.server.allow_hosts
+        return parsed.scheme in ("http", "https") and (allow_hosts is None or parsed.hostname in allow_hosts)
+
+    def _send_in_flight(self, path: str, fetch: _Fetch):
+        fetch.size_known.wait(SIZE_WAIT)
+        if fetch.done.is_set() and not fetch.ok:
+            self.send_error(502, "Upstream fetch failed")
+            return
+        if fetch.total_size is not None:
+            self._send_file(path, fetch.total_size, fetch)
+            return
+        # The size is not known yet (mirrors are still being probed) or upstream did not
+        # send one. Start a chunked response now: the client gets its headers in time, and
+        # a body cut short by a failed fetch lacks the final chunk, so it is still detected.
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._copy(path, 0, None, fetch)
+
+    def _send_file(self, path: str, size: int | None = None, fetch: _Fetch | None = None):
+        if size is None:
+            size = os.path.getsize(path)
+        start, end = 0, size - 1
+        if self.headers.get("Range"):
+            byte_range = _parse_range(self.headers["Range"], size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self._copy(path, start, end - start + 1, fetch)
+
+    def _copy(self, path: str, start: int, length: int | None, fetch: _Fetch | None):
+        """
+        Sends `length` bytes of `path` from `start`, following an in-flight fetch.
+        With a length of None the body is sent chunked until the fetch completes.
+        """
+        chunked = length is None
+        complete = False
+        if fetch is not None:
+            while not os.path.exists(path) and not fetch.done.is_set():
+                time.sleep(0.05) # The fetch thread has not created the partial file yet
+            if not os.path.exists(path) and fetch.ok:
+                path = path[:-len(".part")] # Fetch finished and was moved into place meanwhile
+        try:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = length
+                while remaining is None or remaining > 0:
+                    # Checked before reading, so data written just before the fetch ended is not missed.
+                    fetch_done = fetch is None or fetch.done.is_set()
+                    # Only the read is reserved: holding the budget while a slow client
+                    # accepts the data would stall the upstream fetches feeding the cache.
+                    with membudget.BUDGET.reserve(SEND_CHUNK_SIZE):
+                        chunk = f.read(SEND_CHUNK_SIZE if chunked else min(remaining, SEND_CHUNK_SIZE))
+                    if chunk:
+                        self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                        if not chunked:
+                            remaining -= len(chunk)
+                    elif not fetch_done:
+                        time.sleep(0.05) # Wait for the upstream fetch to write more
+                    else:
+                        break
+                if chunked:
+                    complete = fetch.ok
+                    if complete:
+                        self.wfile.write(b"0\r\n\r\n")
+                else:
+                    complete = remaining == 0
+        except (ConnectionError, OSError):
+            pass # Client went away, or the partial file was removed after a failed fetch
+        if not complete:
+            # Upstream failed; closing early lets the client detect the short body, fail over and resume.
+            self.close_connection = True
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, cache_dir: str = DEFAULT_CACHE_DIR,
+                allow_hosts: list[str] | None = None, max_size: int = DEFAULT_MAX_CACHE_BYTES) -> ThreadingHTTPServer:
+    """
+    Creates the proxy server. `allow_hosts` restricts which upstream hosts it fetches
+    from; without it, any host is fetched.
+    """
+    server = ThreadingHTTPServer((host, port), CacheProxyRequestHandler)
+    server.cache = ArtifactCache(cache_dir, max_size)
+    server.allow_hosts = set(allow_hosts) if allow_hosts else None
+    return server
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, cache_dir: str = DEFAULT_CACHE_DIR,
+          allow_hosts: list[str] | None = None, max_size: int = DEFAULT_MAX_CACHE_BYTES):
+    if not allow_hosts and not is_loopback(host):
+        # Anyone who can reach the proxy could otherwise make it fetch arbitrary URLs.
+        print(f"Error: Refusing to listen on {host} without --allow-host. List the upstream hosts the proxy may fetch from.")
+        return
+    server = make_server(host, port, cache_dir, allow_hosts, max_size)
+    print(f"noox cache proxy listening on http://{host}:{server.server_address[1]} (cache: {server.cache.cache_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down noox cache proxy.")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    import tempfile
+
+    # --- Test Cases ---
+    # Test 1: Range header parsing for a 1000-byte file
+    cases = [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)), # Open-ended
+        ("bytes=-200", (800, 999)), # Suffix: last 200 bytes
+        ("bytes=-5000", (0, 999)), # Suffix longer than the file
+        ("bytes=900-5000", (900, 999)), # End clamped to the file size
+        ("bytes=999-999", (999, 999)),
+        ("bytes=1000-", None), # Starts past the end: unsatisfiable
+        ("bytes=500-100", None), # Start after end
+        ("bytes=-", None),
+        ("bytes=0-1,5-6", None), # Multiple ranges are not supported
+        ("items=0-1", None),
+        (None, None),
+    ]
+    for header, expected in cases:
+        result = _parse_range(header, 1000)
+        print(f"_parse_range({header!r}, 1000) -> {result}")
+        assert result == expected, f"expected {expected}"
+    assert _parse_range("bytes=-0", 1000) is None # Suffix of zero bytes
+    assert _parse_range("bytes=0-", 0) is None # Nothing to serve from an empty file
+
+    # Test 2: The cache key covers the whole mirror list, in any order
+    assert cache_key(["http://a/x", "http://b/x"]) == cache_key(["http://b/x", "http://a/x", "http://a/x"])
+    assert cache_key(["http://a/x"]) != cache_key(["http://a/x", "http://b/x"])
+
+    # Test 3: Least recently used artifacts are evicted past the size limit
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ArtifactCache(cache_dir, max_size=250)
+        for age, key in enumerate(["old", "mid", "new"]):
+            with open(cache.path_for(key), 'wb') as f:
+                f.write(b"x" * 100)
+            os.utime(cache.path_for(key), (1000 + age, 1000 + age))
+            cache.content_index[f"hash-{key}"] = key
+        with open(cache.path_for("pending.part"), 'wb') as f:
+            f.write(b"x" * 100) # In-flight fetches are never evicted
+        cache._evict(keep="old")
+        remaining = sorted(os.listdir(cache_dir))
+        print(f"After eviction: {remaining}, index: {cache.content_index}")
+        assert remaining == ["new", "old", "pending.part"]
+        assert cache.content_index == {"hash-old": "old", "hash-new": "new"}
+    # Test 4: A client-supplied "mirror" can't plant content under another URL
+    class UpstreamHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/evil":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", "8")
+            self.end_headers()
+            self.wfile.write(b"EVILEVIL")
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{upstream.server_address[1]}"
+    with tempfile.TemporaryDirectory() as work_dir:
+        proxy = make_server("127.0.0.1", 0, os.path.join(work_dir, "cache"))
+        threading.Thread(target=proxy.serve_forever, daemon=True).start()
+        proxy_url = f"http://127.0.0.1:{proxy.server_address[1]}"
+        r = requests.get(f"{proxy_url}/fetch", params=[("url", f"{base}/legit-missing"), ("url", f"{base}/evil")], timeout=30)
+        assert r.content == b"EVILEVIL" # Served for the mirror list that asked for it...
+        ok = downloader.download_file(f"{base}/legit-missing", work_dir, "legit", cache_proxy=proxy_url)
+        print(f"Plain request for the legit URL after the poisoning attempt: {'succeeded' if ok else 'failed'}")
+        assert not ok # ...but not for the legit URL alone, which upstream doesn't have
+        proxy.shutdown()
+        proxy.server_close()
+    print("\nAll cache proxy tests passed.")
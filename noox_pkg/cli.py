@@ -1,18 +1,20 @@
 # Placeholder for storing loaded app data
 loaded_apps_data = {}
+loaded_app_options = {} # Scheduling options (priority, deadline, size) per app
 DOWNLOAD_DIR = "downloads" # Default download directory
 
 # Import necessary functions
-from .utils import json_parser, downloader
+from .utils import json_parser, downloader, membudget, profiler, scheduler
 import os # For ensuring download directory exists
 
 def handle_import(filepath: str):
     print(f"CLI: Attempting to import from {filepath}...")
-    parsed_data = json_parser.load_apps_from_json(filepath)
+    with profiler.phase("import"):
+        manifest = json_parser.load_manifest(filepath)
 
-    global loaded_apps_data
-    if parsed_data is not None:
-        loaded_apps_data = parsed_data
+    global loaded_apps_data, loaded_app_options
+    if manifest is not None:
+        loaded_apps_data, loaded_app_options = manifest
         print(f"Successfully imported {len(loaded_apps_data)} apps from {filepath}.")
     else:
         # json_parser already prints specific errors.
@@ -26,9 +28,11 @@ def handle_list_apps():
         print("No applications loaded. Use 'import <filepath>' first.")
         return
     for app_name, url in loaded_apps_data.items():
+        if isinstance(url, list): # Mirror list
+            url = ", ".join(url)
         print(f"- {app_name}: {url}")
 
-def handle_download(app_name: str):
+def handle_download(app_name: str, priority: str | None = None, jobs: int = 1):
     global DOWNLOAD_DIR # Ensure we are using the potentially updated global DOWNLOAD_DIR
 
     try:
@@ -47,20 +51,29 @@ def handle_download(app_name: str):
             return
 
         print(f"CLI: Attempting to download all {len(loaded_apps_data)} applications to '{DOWNLOAD_DIR}'...")
-        all_successful = True
+        # Most urgent apps first (priority, then deadline, then smallest known size).
+        run = scheduler.PriorityScheduler(workers=jobs)
         for name, url in loaded_apps_data.items():
-            print(f"\nStarting download for {name}...")
-            success = downloader.download_file(url, DOWNLOAD_DIR, name)
+            run.submit(scheduler.make_job(name, url, loaded_app_options.get(name), priority))
+
+        def download(job, throttle):
+            name = job["app_name"]
+            print(f"\nStarting download for {name} ({job['priority']} priority)...")
+            success = downloader.download_file(job["url"], DOWNLOAD_DIR, name, throttle=throttle)
             if success:
                 print(f"{name} download completed.")
             else:
                 print(f"{name} download failed. Check errors above.")
-                all_successful = False
+            return success
+
+        all_successful = run.run(download)
 
         if all_successful:
             print("\nAll downloads completed successfully.")
         else:
             print("\nSome downloads failed.")
+        print(run.report())
+        print(membudget.memory_summary())
 
     else:
         if app_name in loaded_apps_data:
@@ -71,6 +84,7 @@ def handle_download(app_name: str):
                 print(f"{app_name} download completed.")
             else:
                 print(f"{app_name} download failed. Check errors above.")
+            print(membudget.memory_summary())
         else:
             print(f"Application '{app_name}' not found in the loaded list.")
 
@@ -107,8 +121,12 @@ if __name__ == '__main__':
                 print(f"[MockJsonParser] Error: File {filepath} not found or invalid.")
                 return None
 
+        def load_manifest(self, filepath):
+            apps = self.load_apps_from_json(filepath)
+            return (apps, {}) if apps is not None else None
+
     class MockDownloader:
-        def download_file(self, url, dest_folder, app_name):
+        def download_file(self, url, dest_folder, app_name, **kwargs):
             print(f"[MockDownloader] Simulating download: {app_name} from {url} to {dest_folder}/{app_name}")
             if "fail" in app_name.lower():
                 return False
@@ -0,0 +1,139 @@
+# Thin CLI client for the noox daemon (see daemon.py). Mirrors the handlers in cli.py,
+# but every operation is sent to the daemon instead of running in this process.
+import os
+
+import requests
+
+from .daemon import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_SERVER = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+def _request(server: str, method: str, path: str, payload: dict | None = None) -> dict | None:
+    """Sends a request to the daemon. Prints the error and returns None on failure."""
+    try:
+        r = requests.request(method, server.rstrip("/") + path, json=payload, timeout=10)
+    except requests.exceptions.RequestException as e:
+        print(f"Error: Could not reach noox daemon at {server}. Is 'serve' running? ({e})")
+        return None
+    try:
+        data = r.json()
+    except ValueError:
+        print(f"Error: Unexpected response from noox daemon (HTTP {r.status_code}).")
+        return None
+    if not r.ok:
+        print(f"Error: {data.get('error', f'HTTP {r.status_code}')}")
+        return None
+    return data
+
+def _print_job(job: dict):
+    progress = f"{job['bytes_downloaded'] // 1024}KB"
+    if job["total_size"]:
+        progress += f" / {job['total_size'] // 1024}KB"
+    print(f"[{job['id']}] {job['app_name']}: {job['status']}, {job['priority']} priority ({progress})")
+
+def handle_import(server: str, filepath: str):
+    # The daemon may run in another directory, so send an absolute path.
+    data = _request(server, "POST", "/import", {"filepath": os.path.abspath(filepath)})
+    if data is not None:
+        print(f"Successfully imported {data['imported']} apps from {filepath}.")
+
+def handle_list_apps(server: str):
+    data = _request(server, "GET", "/apps")
+    if data is None:
+        return
+    if not data["apps"]:
+        print("No applications loaded. Use 'import <filepath>' first.")
+        return
+    for app_name, url in data["apps"].items():
+        if isinstance(url, list): # Mirror list
+            url = ", ".join(url)
+        print(f"- {app_name}: {url}")
+
+def handle_download(server: str, app_name: str, priority: str | None = None):
+    payload = {"all": True} if app_name == "--all" else {"app_name": app_name}
+    if priority:
+        payload["priority"] = priority
+    data = _request(server, "POST", "/jobs", payload)
+    if data is None:
+        return
+    if not data["jobs"]:
+        print("No applications loaded. Use 'import <filepath>' first before downloading.")
+    for job in data["jobs"]:
+        print(f"Queued job {job['id']} for {job['app_name']} ({job['priority']} priority).")
+
+def handle_set_download_dir(server: str, directory: str):
+    data = _request(server, "POST", "/set-dir", {"directory": os.path.abspath(directory)})
+    if data is not None:
+        print(f"Download directory set to: {data['download_dir']}")
+
+def handle_status(server: str, job_id: int | None = None):
+    if job_id is None:
+        data = _request(server, "GET", "/jobs")
+        if data is None:
+            return
+        if not data["jobs"]:
+            print("No jobs.")
+        for job in data["jobs"]:
+            _print_job(job)
+    else:
+        data = _request(server, "GET", f"/jobs/{job_id}")
+        if data is not None:
+            _print_job(data["job"])
+
+def handle_cancel(server: str, job_id: int):
+    data = _request(server, "DELETE", f"/jobs/{job_id}")
+    if data is not None:
+        print(f"Cancellation requested for job {job_id} ({data['job']['app_name']}).")
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import json
+    import tempfile
+    import threading
+    import time
+
+    from . import daemon
+
+    # --- Test Cases: client handlers against a daemon on localhost ---
+    def output_of(handler, *args):
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            handler(*args)
+        print(buffer.getvalue(), end="")
+        return buffer.getvalue()
+
+    # Test 1: An unreachable daemon is reported, not raised
+    assert "Could not reach noox daemon" in output_of(handle_status, "http://127.0.0.1:9")
+
+    test_dir = tempfile.mkdtemp()
+    manifest_path = os.path.join(test_dir, "apps.json")
+    with open(manifest_path, 'w') as f:
+        json.dump({"Broken": "http://127.0.0.1:9/broken", "Mirrored": ["http://127.0.0.1:9/a", "http://127.0.0.1:9/b"]}, f)
+    server = daemon.make_server("127.0.0.1", 0, os.path.join(test_dir, "state.json"), os.path.join(test_dir, "downloads"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Test 2: Import and list, with mirror lists joined
+    assert "Successfully imported 2 apps" in output_of(handle_import, api, manifest_path)
+    listing = output_of(handle_list_apps, api)
+    assert "- Broken: http://127.0.0.1:9/broken" in listing
+    assert "- Mirrored: http://127.0.0.1:9/a, http://127.0.0.1:9/b" in listing
+
+    # Test 3: Download queues a job with the requested priority; it fails (port 9 refuses connections)
+    assert "Queued job 1 for Broken (critical priority)." in output_of(handle_download, api, "Broken", "critical")
+    for _ in range(200):
+        if "failed" in output_of(handle_status, api, 1):
+            break
+        time.sleep(0.05)
+    else:
+        raise AssertionError("Job 1 never failed")
+    assert "[1] Broken: failed, critical priority (0KB)" in output_of(handle_status, api)
+
+    # Test 4: Errors from the daemon are printed
+    assert "Job 1 already failed." in output_of(handle_cancel, api, 1)
+    assert "Job not found." in output_of(handle_cancel, api, 42)
+    assert "Application 'Nope' not found" in output_of(handle_download, api, "Nope")
+    server.shutdown()
+    server.server_close()
+    print("\nAll client tests passed.")
@@ -0,0 +1,493 @@
+import ipaddress
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from .utils import json_parser, downloader, membudget, profiler, scheduler
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_STATE_FILE = "noox_state.json" # Job queue, loaded apps and download dir survive restarts here
+MAX_FINISHED_JOBS = 500 # Older done/failed/cancelled jobs are dropped from the queue and state file
+
+# Job lifecycle: queued -> running -> done | failed | cancelled
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+def is_loopback(host: str) -> bool:
+    """True if `host` only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class JobQueue:
+    """
+    Persistent download queue processed by worker threads, most urgent job first.
+
+    All state (loaded apps, download directory and jobs) is written to a JSON state
+    file whenever it changes, so a restarted daemon picks up where it left off. Jobs
+    that were running when the daemon stopped are queued again.
+
+    Running transfers slow down while a more urgent one runs. When every worker is
+    busy and a job more urgent than all running ones is queued, it starts right away
+    on an extra thread instead of waiting behind a long bulk transfer.
+    """
+
+    def __init__(self, state_file: str = DEFAULT_STATE_FILE, download_dir: str = "downloads"):
+        self.state_file = os.path.abspath(state_file)
+        self.lock = threading.Lock()
+        self.job_available = threading.Condition(self.lock)
+        self.session = requests.Session() # Warm connection pool shared by all jobs
+        self.loaded_apps = {}
+        self.app_options = {}
+        self.download_dir = os.path.abspath(download_dir)
+        self.jobs = {}
+        self.next_id = 1
+        self.cancel_events = {}
+        self._running = Counter() # Priority class -> running jobs, for the throttles
+        self._idle_workers = 0
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read state file {self.state_file}: {e}. Starting with an empty queue.")
+            return
+
+        self.loaded_apps = state.get("apps", {})
+        self.app_options = state.get("app_options", {})
+        self.download_dir = state.get("download_dir", self.download_dir)
+        for job in state.get("jobs", []):
+            if job["status"] == "running":
+                job["status"] = "queued" # Interrupted by a restart
+            job.setdefault("priority", scheduler.DEFAULT_PRIORITY) # State files from before priorities
+            job.setdefault("deadline_at", None)
+            job.setdefault("size", None)
+            self.jobs[job["id"]] = job
+        self.next_id = max(self.jobs, default=0) + 1
+        pending = sum(1 for job in self.jobs.values() if job["status"] == "queued")
+        print(f"Restored {len(self.loaded_apps)} apps and {pending} pending jobs from {self.state_file}")
+
+    def _prune_finished(self):
+        # Caller must hold self.lock. Keeps the state file, and each save, from growing with every run.
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in FINISHED_STATUSES]
+        for job_id in finished[:-MAX_FINISHED_JOBS]: # Ids increase, so the oldest come first
+            del self.jobs[job_id]
+
+    def _save_state(self):
+        # Caller must hold self.lock.
+        self._prune_finished()
+        state = {"apps": self.loaded_apps, "app_options": self.app_options, "download_dir": self.download_dir,
+                 "jobs": list(self.jobs.values())}
+        tmp_path = self.state_file + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            print(f"Warning: Could not write state file {self.state_file}: {e}")
+
+    def import_apps(self, filepath: str) -> dict | None:
+        with profiler.phase("import"):
+            manifest = json_parser.load_manifest(filepath)
+        if manifest is None:
+            return None
+        with self.lock:
+            self.loaded_apps, self.app_options = manifest
+            self._save_state()
+        return self.loaded_apps
+
+    def set_download_dir(self, directory: str) -> bool:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            print(f"Error: Could not create or access directory '{directory}'. {e}")
+            return False
+        with self.lock:
+            self.download_dir = os.path.abspath(directory)
+            self._save_state()
+        return True
+
+    def enqueue(self, app_name: str, priority: str | None = None) -> dict | None:
+        jobs, _ = self.enqueue_many([app_name], priority)
+        return jobs[0] if jobs else None
+
+    def enqueue_many(self, app_names: list[str], priority: str | None = None) -> tuple[list, list]:
+        """
+        Queues a job for each app, saving the state once for the whole batch.
+
+        Returns:
+            tuple[list, list]: The queued jobs, and the names not in the loaded list.
+        """
+        jobs, missing = [], []
+        with self.lock:
+            for app_name in app_names:
+                if app_name not in self.loaded_apps:
+                    missing.append(app_name) # Unknown app, or removed by a concurrent /import
+                    continue
+                job = scheduler.make_job(app_name, self.loaded_apps[app_name], self.app_options.get(app_name), priority)
+                job.update({
+                    "id": self.next_id, "dest_folder": self.download_dir, "status": "queued",
+                    "bytes_downloaded": 0, "total_size": None,
+                })
+                self.jobs[job["id"]] = job
+                self.next_id += 1
+                jobs.append(dict(job))
+            if jobs:
+                self._save_state()
+                self.job_available.notify_all()
+                self._start_urgent_job()
+        return jobs, missing
+
+    def cancel(self, job_id: int) -> dict | None:
+        """Cancels a job. Finished jobs are returned unchanged."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job["status"] = "cancelled"
+                self._save_state()
+            elif job["status"] == "running":
+                self.cancel_events[job_id].set() # Worker records the final status
+            return dict(job)
+
+    def get(self, job_id: int) -> dict | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self) -> list:
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def _most_urgent_queued(self) -> dict | None:
+        # Caller must hold self.lock.
+        queued = [job for job in self.jobs.values() if job["status"] == "queued"]
+        # Most urgent first; ties keep submission order since ids increase.
+        return min(queued, key=lambda job: (scheduler.job_sort_key(job), job["id"]), default=None)
+
+    def _next_job(self) -> dict:
+        # Caller must hold self.lock.
+        while True:
+            job = self._most_urgent_queued()
+            if job is not None:
+                return job
+            self._idle_workers += 1
+            self.job_available.wait()
+            self._idle_workers -= 1
+
+    def _start_job(self, job: dict) -> threading.Event:
+        # Caller must hold self.lock.
+        job["status"] = "running"
+        self._running[job["priority"]] += 1
+        cancel_event = threading.Event()
+        self.cancel_events[job["id"]] = cancel_event
+        self._save_state()
+        return cancel_event
+
+    def _start_urgent_job(self):
+        # Caller must hold self.lock. Idle workers pick up new jobs themselves.
+        running = [priority for priority, count in self._running.items() if count]
+        if self._idle_workers or not running:
+            return
+        job = self._most_urgent_queued()
+        if job is None or not all(scheduler.outranks(job["priority"], priority) for priority in running):
+            return
+        cancel_event = self._start_job(job)
+        threading.Thread(target=self._run_job, args=(job, cancel_event), daemon=True).start()
+
+    def run_worker(self):
+        """Processes queued jobs forever. Meant to run in a daemon thread."""
+        while True:
+            with self.lock:
+                job = self._next_job()
+                cancel_event = self._start_job(job)
+            self._run_job(job, cancel_event)
+
+    def _run_job(self, job: dict, cancel_event: threading.Event):
+        def progress_callback(bytes_downloaded, total_size, percentage):
+            # Progress is kept in memory only; persisting every chunk would be too costly.
+            job["bytes_downloaded"] = bytes_downloaded
+            job["total_size"] = total_size
+
+        print(f"Job {job['id']}: downloading {job['app_name']} ({job['priority']} priority)...")
+        success = downloader.download_file(job["url"], job["dest_folder"], job["app_name"],
+                                           progress_callback=progress_callback, session=self.session,
+                                           cancel_event=cancel_event,
+                                           throttle=scheduler.make_throttle(self._running, job["priority"]))
+        with self.lock:
+            if success:
+                job["status"] = "done"
+            else:
+                job["status"] = "cancelled" if cancel_event.is_set() else "failed"
+            self._running[job["priority"]] -= 1
+            del self.cancel_events[job["id"]]
+            self._save_state()
+            queue_drained = not any(j["status"] in ("queued", "running") for j in self.jobs.values())
+        print(f"Job {job['id']}: {job['app_name']} {job['status']}.")
+        if queue_drained:
+            print(f"Queue empty. {membudget.memory_summary()}")
+
+class NooxRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over localhost HTTP:
+
+        GET    /apps          loaded applications
+        POST   /import        {"filepath": ...}
+        POST   /set-dir       {"directory": ...}
+        GET    /jobs          all jobs
+        POST   /jobs          {"app_name": ...} or {"all": true}, optionally with "priority"
+        GET    /jobs/<id>     one job
+        DELETE /jobs/<id>     cancel a job
+    """
+    server_version = "noox"
+
+    @property
+    def queue(self) -> JobQueue:
+        return self.server.job_queue
+
+    def log_message(self, format, *args):
+        pass # Keep the daemon console for job output
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            data = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _job_id(self) -> int | None:
+        job_id = self.path[len("/jobs/"):]
+        return int(job_id) if job_id.isdigit() else None
+
+    def do_GET(self):
+        if self.path == "/apps":
+            with self.queue.lock:
+                self._send_json(200, {"apps": self.queue.loaded_apps, "download_dir": self.queue.download_dir})
+        elif self.path == "/jobs":
+            self._send_json(200, {"jobs": self.queue.list_jobs()})
+        elif self.path.startswith("/jobs/"):
+            job = self.queue.get(self._job_id())
+            if job is None:
+                self._send_json(404, {"error": "Job not found."})
+            else:
+                self._send_json(200, {"job": job})
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        # A web page can send a "simple" cross-site POST to localhost without a CORS
+        # preflight, but only with a form or text/plain content type.
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json."})
+            return
+        data = self._read_json()
+        if self.path == "/import":
+            filepath = data.get("filepath")
+            apps = self.queue.import_apps(filepath) if filepath else None
+            if apps is None:
+                self._send_json(400, {"error": f"Import failed from {filepath}. Check the daemon console."})
+            else:
+                self._send_json(200, {"imported": len(apps)})
+        elif self.path == "/set-dir":
+            directory = data.get("directory")
+            if directory and self.queue.set_download_dir(directory):
+                self._send_json(200, {"download_dir": self.queue.download_dir})
+            else:
+                self._send_json(400, {"error": f"Could not create or access directory '{directory}'."})
+        elif self.path == "/jobs":
+            if data.get("all"):
+                with self.queue.lock:
+                    app_names = list(self.queue.loaded_apps)
+            elif data.get("app_name"):
+                app_names = [data["app_name"]]
+            else:
+                self._send_json(400, {"error": "Specify app_name or all."})
+                return
+            priority = data.get("priority")
+            if priority is not None and priority not in scheduler.PRIORITIES:
+                self._send_json(400, {"error": f"Priority must be one of {', '.join(scheduler.PRIORITIES)}."})
+                return
+            jobs, missing = self.queue.enqueue_many(app_names, priority)
+            if missing and not jobs:
+                self._send_json(404, {"error": f"Application '{missing[0]}' not found in the loaded list."})
+            else:
+                self._send_json(201, {"jobs": jobs})
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_DELETE(self):
+        if self.path.startswith("/jobs/"):
+            job = self.queue.cancel(self._job_id())
+            if job is None:
+                self._send_json(404, {"error": "Job not found."})
+            elif job["status"] in ("done", "failed"):
+                self._send_json(409, {"error": f"Job {job['id']} already {job['status']}."})
+            else:
+                self._send_json(200, {"job": job})
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, state_file: str = DEFAULT_STATE_FILE,
+                download_dir: str = "downloads", workers: int = 1) -> ThreadingHTTPServer:
+    """Creates the API server and starts its download worker threads."""
+    server = ThreadingHTTPServer((host, port), NooxRequestHandler)
+    server.job_queue = JobQueue(state_file, download_dir)
+    for _ in range(max(1, workers)):
+        threading.Thread(target=server.job_queue.run_worker, daemon=True).start()
+    return server
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, state_file: str = DEFAULT_STATE_FILE,
+          download_dir: str = "downloads", workers: int = 1):
+    if not is_loopback(host):
+        # The API has no authentication: anyone who can reach it could import local files,
+        # change the download directory and queue downloads.
+        print(f"Error: Refusing to listen on {host}. The noox daemon API is only served on localhost.")
+        return
+    server = make_server(host, port, state_file, download_dir, workers)
+    print(f"noox daemon listening on http://{host}:{server.server_address[1]} (state: {server.job_queue.state_file})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down noox daemon. Pending jobs will resume on next start.")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from . import client
+
+    # --- Test Cases: localhost round trip through the HTTP API ---
+    test_dir = tempfile.mkdtemp()
+    release_slow = threading.Event()
+
+    class UpstreamHandler(BaseHTTPRequestHandler):
+        """Serves a small file at /fast; /slow only finishes once release_slow is set."""
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body = b"x" * 1024
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.path == "/slow":
+                release_slow.wait(10)
+            self.wfile.write(body)
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{upstream.server_address[1]}"
+    manifest_path = os.path.join(test_dir, "apps.json")
+    with open(manifest_path, 'w') as f:
+        json.dump({"Slow": f"{base}/slow", "Fast1": f"{base}/fast", "Fast2": f"{base}/fast"}, f)
+
+    state_file = os.path.join(test_dir, "state.json")
+    server = make_server("127.0.0.1", 0, state_file, os.path.join(test_dir, "downloads"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def wait_for_status(job_id, status):
+        for _ in range(200):
+            if client._request(api, "GET", f"/jobs/{job_id}")["job"]["status"] == status:
+                return
+            time.sleep(0.05)
+        raise AssertionError(f"Job {job_id} never reached {status}")
+
+    # Test 1: Import, then queue every app in one request
+    assert client._request(api, "POST", "/import", {"filepath": manifest_path}) == {"imported": 3}
+    jobs = client._request(api, "POST", "/jobs", {"all": True})["jobs"]
+    print(f"Queued: {[(job['id'], job['app_name']) for job in jobs]}")
+    assert [job["app_name"] for job in jobs] == ["Slow", "Fast1", "Fast2"]
+
+    # Test 2: Status while the first job is running; the others wait in the queue
+    wait_for_status(1, "running")
+    statuses = {job["id"]: job["status"] for job in client._request(api, "GET", "/jobs")["jobs"]}
+    print(f"Statuses: {statuses}")
+    assert statuses == {1: "running", 2: "queued", 3: "queued"}
+
+    # Test 3: Cancelling a queued job takes effect immediately
+    assert client._request(api, "DELETE", "/jobs/3")["job"]["status"] == "cancelled"
+
+    # Test 4: Finished jobs can't be cancelled (409), unknown ones are 404
+    release_slow.set()
+    wait_for_status(1, "done")
+    wait_for_status(2, "done")
+    r = requests.delete(f"{api}/jobs/2", timeout=5)
+    print(f"Cancel finished job: {r.status_code} {r.json()}")
+    assert r.status_code == 409
+    assert requests.delete(f"{api}/jobs/99", timeout=5).status_code == 404
+
+    # Test 5: POSTs without a JSON content type are rejected (cross-site form/text posts)
+    r = requests.post(f"{api}/jobs", data='{"all": true}', headers={"Content-Type": "text/plain"}, timeout=5)
+    print(f"text/plain POST: {r.status_code}")
+    assert r.status_code == 415
+    assert client._request(api, "POST", "/jobs", {"app_name": "Nope"}) is None
+
+    # Test 6: An urgent job starts at once, even while the only worker runs a bulk job
+    release_slow.clear()
+    bulk = client._request(api, "POST", "/jobs", {"app_name": "Slow", "priority": "low"})["jobs"][0]
+    wait_for_status(bulk["id"], "running")
+    urgent = client._request(api, "POST", "/jobs", {"app_name": "Fast1", "priority": "critical"})["jobs"][0]
+    wait_for_status(urgent["id"], "done")
+    bulk_status = client._request(api, "GET", f"/jobs/{bulk['id']}")["job"]["status"]
+    print(f"Critical job done while the low priority job is {bulk_status}")
+    assert bulk_status == "running"
+    release_slow.set()
+    wait_for_status(bulk["id"], "done")
+    server.shutdown()
+    server.server_close()
+
+    # Test 7: A restart queues jobs that were running when the daemon stopped
+    with open(state_file) as f:
+        state = json.load(f)
+    state["jobs"][0]["status"] = "running"
+    with open(state_file, 'w') as f:
+        json.dump(state, f)
+    restored = JobQueue(state_file)
+    print(f"Restored: {[(job['id'], job['status']) for job in restored.list_jobs()]}")
+    assert [job["status"] for job in restored.list_jobs()] == ["queued", "done", "cancelled", "done", "done"]
+    assert restored.next_id == 6
+
+    # Test 8: A bulk enqueue saves once, and finished job history is capped
+    restored.loaded_apps = {f"App{i}": f"{base}/fast" for i in range(MAX_FINISHED_JOBS + 50)}
+    queued, missing = restored.enqueue_many(list(restored.loaded_apps) + ["Gone"])
+    assert len(queued) == MAX_FINISHED_JOBS + 50 and missing == ["Gone"]
+    with restored.lock:
+        for job in restored.jobs.values():
+            job["status"] = "done"
+        restored._save_state()
+    with open(state_file) as f:
+        saved = json.load(f)["jobs"]
+    print(f"Jobs kept after pruning: {len(saved)} (ids {saved[0]['id']}..{saved[-1]['id']})")
+    assert len(saved) == MAX_FINISHED_JOBS and saved[-1]["id"] == restored.next_id - 1
+
+    # Test 9: The API is never served beyond localhost
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0") and not is_loopback("192.168.1.10")
+    serve("0.0.0.0", 0, state_file) # Prints an error and returns
+    print("\nAll daemon tests passed.")
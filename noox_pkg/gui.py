@@ -5,7 +5,7 @@ import threading
 # import queue # Not using queue for this approach
 
 # Assuming utils is in the same package directory
-from .utils import json_parser, downloader
+from .utils import json_parser, downloader, membudget, profiler, scheduler
 
 # Fallback for DOWNLOAD_DIR if cli module is not found
 try:
@@ -73,15 +73,17 @@ class AppGUI:
 
         self.current_download_dir = CLI_DOWNLOAD_DIR
         self.loaded_apps = {}
+        self.loaded_app_options = {} # Scheduling options from the JSON file
+        self.priority_overrides = {} # Priorities chosen in the GUI, by app name
         main_frame = ttk.Frame(self.root, padding="10", style='Main.TFrame')
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.root.columnconfigure(0, weight=1); self.root.rowconfigure(0, weight=1)
         app_list_frame = ttk.LabelFrame(main_frame, text="Applications", padding="10", style='Custom.TLabelframe')
         app_list_frame.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
         app_list_frame.columnconfigure(0, weight=1); app_list_frame.rowconfigure(0, weight=1)
-        self.app_tree = ttk.Treeview(app_list_frame, columns=("App Name", "URL"), show="headings", style='Custom.Treeview')
-        self.app_tree.heading("App Name", text="App Name"); self.app_tree.heading("URL", text="URL")
-        self.app_tree.column("App Name", width=200, stretch=tk.YES); self.app_tree.column("URL", width=400, stretch=tk.YES)
+        self.app_tree = ttk.Treeview(app_list_frame, columns=("App Name", "Priority", "URL"), show="headings", style='Custom.Treeview')
+        self.app_tree.heading("App Name", text="App Name"); self.app_tree.heading("Priority", text="Priority"); self.app_tree.heading("URL", text="URL")
+        self.app_tree.column("App Name", width=200, stretch=tk.YES); self.app_tree.column("Priority", width=80, stretch=tk.NO); self.app_tree.column("URL", width=400, stretch=tk.YES)
         tree_scrollbar_y = ttk.Scrollbar(app_list_frame, orient="vertical", command=self.app_tree.yview, style='Custom.Vertical.TScrollbar')
         tree_scrollbar_x = ttk.Scrollbar(app_list_frame, orient="horizontal", command=self.app_tree.xview, style='Custom.Horizontal.TScrollbar')
         self.app_tree.configure(yscrollcommand=tree_scrollbar_y.set, xscrollcommand=tree_scrollbar_x.set)
@@ -100,6 +102,11 @@ class AppGUI:
         self.scheme_combobox = ttk.Combobox(main_frame, values=list(self.color_schemes.keys()), state="readonly", width=15)
         self.scheme_combobox.set(self.current_scheme_name); self.scheme_combobox.grid(row=2, column=1, padx=(0,5), pady=5, sticky=tk.W)
         self.scheme_combobox.bind("<<ComboboxSelected>>", self.on_scheme_selected)
+        priority_label = ttk.Label(main_frame, text="Priority of Selected:"); priority_label.configure(background='#1A1A1A', foreground='#E0E0E0')
+        priority_label.grid(row=2, column=2, padx=(5,0), pady=5, sticky=tk.E)
+        self.priority_combobox = ttk.Combobox(main_frame, values=list(scheduler.PRIORITIES), state="readonly", width=15)
+        self.priority_combobox.set(scheduler.DEFAULT_PRIORITY); self.priority_combobox.grid(row=2, column=3, padx=(0,5), pady=5, sticky=tk.W)
+        self.priority_combobox.bind("<<ComboboxSelected>>", self.on_priority_selected)
         self.progress_bar = ttk.Progressbar(main_frame, orient='horizontal', mode='determinate', length=200, style='Accent.Horizontal.TProgressbar')
         self.progress_bar.grid(row=3, column=0, columnspan=4, padx=5, pady=(5,0), sticky=(tk.W, tk.E)); self.progress_bar['value'] = 0
         self.status_bar_text = tk.StringVar(); self.update_status(f"Ready. Download directory: {self.current_download_dir}")
@@ -129,10 +136,19 @@ class AppGUI:
 
     def _download_thread_target(self, url, app_name, dest_folder):
         try:
+            last_reported = [None] # Tk callbacks are only queued when the shown value changes
+            pending, pending_lock = {}, threading.Lock() # Latest progress not yet shown; at most one Tk callback queued
+            def show_pending_progress():
+                with pending_lock: percentage, current_size_str = pending.pop("progress")
+                self._update_gui_progress(percentage, current_size_str)
             def progress_callback_wrapper(bytes_downloaded, total_size, percentage):
+                step = int(percentage) if percentage is not None else bytes_downloaded // (512 * 1024)
+                if step == last_reported[0] and bytes_downloaded != total_size: return
+                last_reported[0] = step
                 current_size_str = f"{bytes_downloaded // 1024}KB"
                 if total_size: current_size_str = f"{bytes_downloaded // 1024}KB / {total_size // 1024}KB"
-                self.root.after_idle(self._update_gui_progress, percentage, current_size_str)
+                with pending_lock: queued = "progress" in pending; pending["progress"] = (percentage, current_size_str)
+                if not queued: self.root.after_idle(show_pending_progress) # A busy Tk loop sees only the newest value
 
             success = downloader.download_file(url, dest_folder, app_name, progress_callback=progress_callback_wrapper)
             final_message = ""
@@ -153,7 +169,8 @@ class AppGUI:
     def download_selected(self):
         selected_items = self.app_tree.selection()
         if not selected_items: messagebox.showwarning("No Selection", "Please select an application to download."); self.update_status("No application selected."); return
-        item_values = self.app_tree.item(selected_items[0], 'values'); app_name, url = item_values[0], item_values[1]
+        item_values = self.app_tree.item(selected_items[0], 'values'); app_name = item_values[0]
+        url = self.loaded_apps.get(app_name, item_values[2]) # Tree shows mirrors joined; use the original list
         if not self.create_dir_if_not_exists(self.current_download_dir):
             messagebox.showerror("Download Error", f"Directory {self.current_download_dir} error."); self.update_status("Dir error."); return
         self.prepare_for_download(); self.update_status(f"Starting download for {app_name}...")
@@ -164,7 +181,8 @@ class AppGUI:
         if not self.apps_to_download_queue:
             self.is_downloading_all = False; self.root.after_idle(self.cleanup_after_download)
             self.root.after_idle(self.update_status, "All application downloads attempted.")
-            self.root.after_idle(messagebox.showinfo, "Download All Complete", "All downloads attempted. Check console/status.")
+            summary = membudget.memory_summary(); print(summary)
+            self.root.after_idle(messagebox.showinfo, "Download All Complete", f"All downloads attempted. Check console/status.\n{summary}")
             return
         app_name, url = self.apps_to_download_queue.pop(0)
         self.root.after_idle(self._update_gui_progress, 0, "0KB / ---") # Reset progress for next item
@@ -180,7 +198,9 @@ class AppGUI:
     def download_all(self):
         if not self.loaded_apps: messagebox.showwarning("No Apps", "No applications loaded."); self.update_status("No apps to download."); return
         if not self.create_dir_if_not_exists(self.current_download_dir): messagebox.showerror("Download Error", f"Directory {self.current_download_dir} error."); self.update_status("Dir error."); return
-        self.apps_to_download_queue = list(self.loaded_apps.items())
+        # Most urgent apps first (priority, then deadline, then smallest known size).
+        jobs = [scheduler.make_job(name, url, self.loaded_app_options.get(name), self.priority_overrides.get(name)) for name, url in self.loaded_apps.items()]
+        self.apps_to_download_queue = [(job["app_name"], job["url"]) for job in sorted(jobs, key=scheduler.job_sort_key)]
         if not self.apps_to_download_queue: messagebox.showinfo("Download All", "No apps in queue."); return
         self.is_downloading_all = True; self.prepare_for_download(); self.update_status(f"Queueing all {len(self.apps_to_download_queue)} apps...")
         self._start_next_download_in_queue()
@@ -211,9 +231,10 @@ class AppGUI:
         filepath = filedialog.askopenfilename(title="Select JSON file", filetypes=(("JSON files", "*.json"), ("All files", "*.*")))
         if filepath:
             try:
-                data = json_parser.load_apps_from_json(filepath)
-                if data is not None:
-                    self.loaded_apps = data; self.populate_app_list(); filename = os.path.basename(filepath)
+                with profiler.phase("import"): manifest = json_parser.load_manifest(filepath)
+                if manifest is not None:
+                    self.loaded_apps, self.loaded_app_options = manifest; self.priority_overrides = {}
+                    self.populate_app_list(); filename = os.path.basename(filepath)
                     self.update_status(f"Imported {len(self.loaded_apps)} apps from {filename}.")
                     if not self.loaded_apps: messagebox.showinfo("Import Info", f"JSON '{filename}' valid but no apps.")
                 else: filename = os.path.basename(filepath); self.update_status(f"Failed import from {filename}."); messagebox.showerror("Import Error", f"Could not load from {filename}.")
@@ -222,7 +243,21 @@ class AppGUI:
 
     def populate_app_list(self):
         for i in self.app_tree.get_children(): self.app_tree.delete(i)
-        for app_name, url in self.loaded_apps.items(): self.app_tree.insert("", tk.END, values=(app_name, url))
+        for app_name, url in self.loaded_apps.items():
+            display_url = ", ".join(url) if isinstance(url, list) else url
+            self.app_tree.insert("", tk.END, values=(app_name, self.get_app_priority(app_name), display_url))
+
+    def get_app_priority(self, app_name):
+        if app_name in self.priority_overrides: return self.priority_overrides[app_name]
+        return self.loaded_app_options.get(app_name, {}).get("priority", scheduler.DEFAULT_PRIORITY)
+
+    def on_priority_selected(self, event):
+        priority = self.priority_combobox.get(); selected_items = self.app_tree.selection()
+        if not selected_items: self.update_status("Select applications to change their priority."); return
+        for item in selected_items:
+            app_name = self.app_tree.item(item, 'values')[0]; self.priority_overrides[app_name] = priority
+            self.app_tree.set(item, "Priority", priority)
+        self.update_status(f"Priority of {len(selected_items)} app(s) set to {priority}.")
 
 
     def set_download_dir(self):
@@ -5,10 +5,20 @@ import sys
 # Adjust imports to include start_gui
 from .cli import handle_import, handle_list_apps, handle_download, handle_set_download_dir, DOWNLOAD_DIR
 from .gui import start_gui # New import for GUI
+from . import client, daemon, cache_proxy
+from .utils import downloader, membudget, profiler, scheduler
 
 def main():
     parser = argparse.ArgumentParser(description="noox pkg - A CLI application downloader with GUI support.")
     # Removed required=True from subparsers to allow defaulting to GUI
+    parser.add_argument("--server", type=str, default=None, metavar="URL",
+                        help=f"Send import/list/download/set-dir to a running noox daemon (e.g. {client.DEFAULT_SERVER}).")
+    parser.add_argument("--cache-proxy", type=str, default=None, metavar="URL",
+                        help="Try this noox cache proxy before downloading from upstream (default: $NOOX_CACHE_PROXY).")
+    parser.add_argument("--memory-budget", type=int, default=None, metavar="MB",
+                        help=f"Limit on buffered download data across all transfers (default: {membudget.DEFAULT_BUDGET_BYTES // (1024 * 1024)} MB).")
+    parser.add_argument("--profile", type=str, default=None, metavar="DIR",
+                        help="Profile the import/download hot paths and write per-phase cProfile data and collapsed stacks to DIR.")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Import command
@@ -22,6 +32,10 @@ def main():
     download_parser = subparsers.add_parser("download", help="Download an application. Specify an app name or use --all-apps.")
     download_parser.add_argument("app_name", type=str, nargs='?', default=None, help="Name of the specific app to download.")
     download_parser.add_argument("--all-apps", action="store_true", help="Download all applications from the loaded list.")
+    download_parser.add_argument("--priority", choices=scheduler.PRIORITIES, default=None,
+                                 help="Priority class for this submission, overriding the JSON file.")
+    download_parser.add_argument("--jobs", type=int, default=1,
+                                 help="Number of downloads to run at once with --all-apps. Urgent downloads get most of the bandwidth.")
 
     # Set download directory command
     set_dir_parser = subparsers.add_parser("set-dir", help="Set the download directory for files.")
@@ -30,13 +44,60 @@ def main():
     # GUI command - New
     gui_parser = subparsers.add_parser("gui", help="Launch the Graphical User Interface.")
 
+    # Daemon commands
+    serve_parser = subparsers.add_parser("serve", help="Run noox as a background daemon with a local HTTP API.")
+    serve_parser.add_argument("--host", type=str, default=daemon.DEFAULT_HOST, help="Address to listen on (loopback only).")
+    serve_parser.add_argument("--port", type=int, default=daemon.DEFAULT_PORT, help="Port to listen on.")
+    serve_parser.add_argument("--state-file", type=str, default=daemon.DEFAULT_STATE_FILE,
+                              help="File where the job queue is persisted across restarts.")
+    serve_parser.add_argument("--jobs", type=int, default=1,
+                              help="Number of downloads to run at once. Urgent jobs also start early when all are busy.")
+
+    proxy_parser = subparsers.add_parser("cache-proxy", help="Serve downloaded artifacts to other noox instances on the LAN.")
+    proxy_parser.add_argument("--host", type=str, default=cache_proxy.DEFAULT_HOST, help="Address to listen on.")
+    proxy_parser.add_argument("--port", type=int, default=cache_proxy.DEFAULT_PORT, help="Port to listen on.")
+    proxy_parser.add_argument("--cache-dir", type=str, default=cache_proxy.DEFAULT_CACHE_DIR,
+                              help="Directory where cached artifacts are stored.")
+    proxy_parser.add_argument("--allow-host", action="append", default=None, metavar="HOST",
+                              help="Upstream host the proxy may fetch from. Repeat for several hosts. Required unless listening on localhost.")
+    proxy_parser.add_argument("--max-cache-size", type=int, default=cache_proxy.DEFAULT_MAX_CACHE_BYTES // (1024 * 1024),
+                              metavar="MB", help="Remove the least recently used artifacts once the cache grows past this size.")
+
+    status_parser = subparsers.add_parser("status", help="Show daemon download jobs.")
+    status_parser.add_argument("job_id", type=int, nargs='?', default=None, help="Show only this job.")
+
+    cancel_parser = subparsers.add_parser("cancel", help="Cancel a daemon download job.")
+    cancel_parser.add_argument("job_id", type=int, help="ID of the job to cancel.")
+
     args = parser.parse_args()
 
+    if args.cache_proxy:
+        downloader.CACHE_PROXY = args.cache_proxy
+    if args.memory_budget is not None:
+        if args.memory_budget <= 0:
+            parser.error("--memory-budget must be a positive number of MB.")
+        membudget.BUDGET.set_limit(args.memory_budget * 1024 * 1024)
+
+    if args.profile:
+        profiler.start(args.profile)
+    try:
+        run_command(args, download_parser)
+    finally:
+        profiler.stop()
+
+def run_command(args, download_parser):
+    """Dispatches the parsed command."""
     # If no command is given or 'gui' command is explicitly used, launch GUI.
     if args.command is None or args.command == "gui":
         if args.command is None:
             print("No command specified, launching GUI...")
         start_gui()
+    elif args.command == "serve":
+        daemon.serve(args.host, args.port, args.state_file, DOWNLOAD_DIR, args.jobs)
+    elif args.command == "cache-proxy":
+        cache_proxy.serve(args.host, args.port, args.cache_dir, args.allow_host, args.max_cache_size * 1024 * 1024)
+    elif args.command in ("status", "cancel") or args.server:
+        handle_remote_command(args, download_parser)
     elif args.command == "import":
         # Ensure DOWNLOAD_DIR exists for commands that might need it.
         if not os.path.exists(DOWNLOAD_DIR):
@@ -50,10 +111,12 @@ def main():
             os.makedirs(DOWNLOAD_DIR, exist_ok=True)
             print(f"Created download directory at: {DOWNLOAD_DIR}")
 
+        if args.jobs < 1:
+            download_parser.error("--jobs must be at least 1.")
         if args.all_apps:
             if args.app_name:
                 download_parser.error("Cannot specify an app_name when --all-apps is used.")
-            handle_download("--all")
+            handle_download("--all", args.priority, args.jobs)
         elif args.app_name:
             handle_download(args.app_name)
         else:
@@ -66,5 +129,29 @@ def main():
         handle_set_download_dir(args.directory)
     # No other commands expected at this point based on parser setup
 
+def handle_remote_command(args, download_parser):
+    """Runs a command against the noox daemon instead of in this process."""
+    server = args.server or client.DEFAULT_SERVER
+    if args.command == "import":
+        client.handle_import(server, args.filepath)
+    elif args.command == "list":
+        client.handle_list_apps(server)
+    elif args.command == "download":
+        if args.all_apps:
+            if args.app_name:
+                download_parser.error("Cannot specify an app_name when --all-apps is used.")
+            client.handle_download(server, "--all", args.priority)
+        elif args.app_name:
+            client.handle_download(server, args.app_name, args.priority)
+        else:
+            download_parser.print_help()
+            sys.exit(1)
+    elif args.command == "set-dir":
+        client.handle_set_download_dir(server, args.directory)
+    elif args.command == "status":
+        client.handle_status(server, args.job_id)
+    elif args.command == "cancel":
+        client.handle_cancel(server, args.job_id)
+
 if __name__ == "__main__":
     main()
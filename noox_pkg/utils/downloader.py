@@ -1,27 +1,259 @@
 import requests
 import os
+import queue
+import re
+import threading
+import time
+from urllib.parse import urlencode
+
+from . import mirrors, membudget, profiler
 
 # Default download directory (relative to where script is run or module is imported)
 # This is not used by the function itself but can be a reference if this file were run standalone.
 # DOWNLOAD_DIR = "downloads"
 
-def download_file(url: str, dest_folder: str, app_name: str, progress_callback=None):
+# Base URL of a noox cache proxy (see cache_proxy.py) to try before going upstream.
+# Set from the --cache-proxy option, or the NOOX_CACHE_PROXY environment variable.
+CACHE_PROXY = os.environ.get("NOOX_CACHE_PROXY") or None
+
+CHUNK_SIZE = 8192
+TIMEOUT = 10
+# (connect, read) timeout for the cache proxy. On a miss the proxy may still be probing
+# mirrors or waiting on the upstream server, so allow longer gaps between bytes.
+PROXY_TIMEOUT = (10, 60)
+
+class DownloadCancelled(Exception):
+    """Raised inside the transfer loop when a download is cancelled."""
+
+class _ChunkWriter:
+    """
+    Writes downloaded chunks to a file from its own thread.
+
+    The reader acquires CHUNK_SIZE from the shared memory budget before each socket
+    read and hands the chunk over with put(); this thread releases it once the chunk is
+    on disk. When writers fall behind and the budget is used up, readers block before
+    reading, so the sockets stop being drained and TCP slows the senders down.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.error = None
+        self._queue = queue.Queue()
+        self._prof = profiler.ACTIVE
+        self._thread = threading.Thread(target=self._run, name="noox-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, chunk: bytes):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(chunk)
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            try:
+                if self.error is None: # After a failed write, only drain and release
+                    self._write(chunk)
+            except OSError as e:
+                self.error = e
+            finally:
+                membudget.BUDGET.release(CHUNK_SIZE)
+
+    def _write(self, chunk: bytes):
+        if self._prof is None:
+            self.f.write(chunk)
+            return
+        # Only the write itself is a phase, so idle waits on the queue are not profiled.
+        with self._prof.phase("write"):
+            self.f.write(chunk)
+
+    def close(self):
+        """Waits until every queued chunk is written. Raises the first write error, if any."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelled()
+
+def _parse_content_range(header: str | None) -> tuple[int, int | None] | None:
+    """Parses 'bytes start-end/total' into (start, total). total is None for '*'."""
+    m = re.fullmatch(r'bytes (\d+)-\d+/(\d+|\*)', (header or '').strip())
+    if not m:
+        return None
+    return int(m.group(1)), int(m.group(2)) if m.group(2) != '*' else None
+
+def _total_size_from_response(r) -> int | None:
+    """Returns the full file size advertised by a response, if any."""
+    if r.status_code == 206:
+        content_range = _parse_content_range(r.headers.get('content-range'))
+        return content_range[1] if content_range else None
+    content_length = r.headers.get('content-length')
+    return int(content_length) if content_length else None
+
+def _range_matches(r, offset: int, total_size_in_bytes: int | None) -> bool:
+    """Checks that a 206 response starts at `offset` and is of the file size seen so far."""
+    content_range = _parse_content_range(r.headers.get('content-range'))
+    if content_range is None or content_range[0] != offset:
+        return False
+    total = content_range[1]
+    return total is None or total_size_in_bytes is None or total == total_size_in_bytes
+
+def _stream_from_mirror(url: str, f, transfer: dict, progress_callback=None,
+                        session=None, cancel_event=None, throttle=None, timeout=TIMEOUT):
+    """
+    Streams a file from one mirror into an open file object.
+
+    The download resumes from the current position of `f` using a Range request.
+    If the mirror ignores the Range header, answers with a different range, or
+    reports a different file size than the previous mirror (e.g. another build),
+    the file is truncated and the download starts again from the beginning.
+
+    `transfer["total_size"]` holds the total size of the file once known. It is kept
+    up to date even if the mirror fails, so the next mirror can be checked against it.
+
+    Raises:
+        requests.exceptions.RequestException: If the mirror fails. The file position
+            then reflects how many bytes were written, so the next mirror can resume.
+        DownloadCancelled: If `cancel_event` is set during the transfer.
+    """
+    offset = f.tell()
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+    with (session or requests).get(url, stream=True, timeout=timeout, headers=headers) as r:
+        _check_cancelled(cancel_event) # Cancelled while waiting for the response headers
+        r.raise_for_status()
+
+        restart = offset and r.status_code == 206 and not _range_matches(r, offset, transfer["total_size"])
+        if restart:
+            print(f"Warning: {url} returned range {r.headers.get('content-range')!r}, which does not continue "
+                  f"the partial download at byte {offset}. Restarting download from the beginning.")
+        elif offset and r.status_code != 206:
+            print(f"Warning: {url} does not support resuming. Restarting download from the beginning.")
+            f.seek(0)
+            f.truncate()
+            offset = 0
+            transfer["total_size"] = None # This mirror's file is the one being downloaded now
+
+        if not restart:
+            _stream_response(r, f, offset, transfer, progress_callback, cancel_event, throttle)
+
+    if restart:
+        # The partial file can't be trusted; fetch the whole file from this mirror.
+        f.seek(0)
+        f.truncate()
+        transfer["total_size"] = None
+        _stream_from_mirror(url, f, transfer, progress_callback, session=session,
+                            cancel_event=cancel_event, throttle=throttle, timeout=timeout)
+
+def _stream_response(r, f, offset: int, transfer: dict, progress_callback, cancel_event, throttle):
+    """Writes the body of an open response to `f`, which is positioned at `offset`."""
+    if transfer["total_size"] is None:
+        transfer["total_size"] = _total_size_from_response(r)
+        if offset == 0:
+            if transfer["total_size"]:
+                if progress_callback:
+                    progress_callback(0, transfer["total_size"], 0)
+            else:
+                print("Warning: Content-Length header not found. Progress percentage will not be available.")
+                if progress_callback:
+                    progress_callback(0, None, None)
+    total_size_in_bytes = transfer["total_size"]
+
+    bytes_downloaded = offset
+    prof = profiler.ACTIVE
+    chunks = r.iter_content(chunk_size=CHUNK_SIZE)
+    writer = _ChunkWriter(f)
+    try:
+        while True:
+            if throttle is not None:
+                throttle()
+            if prof is not None:
+                loop_start = time.perf_counter_ns()
+            _check_cancelled(cancel_event)
+            # Blocks while the writers are behind and the process-wide budget is used up.
+            membudget.BUDGET.acquire(CHUNK_SIZE)
+            if prof is not None:
+                read_start = time.perf_counter_ns()
+            try:
+                chunk = next(chunks, None)
+            except BaseException:
+                membudget.BUDGET.release(CHUNK_SIZE)
+                raise
+            if prof is not None:
+                read_ns = time.perf_counter_ns() - read_start
+            if not chunk:
+                membudget.BUDGET.release(CHUNK_SIZE)
+                if chunk is None:
+                    break
+                continue
+            try:
+                writer.put(chunk) # The writer releases the reservation once the chunk is written
+            except BaseException: # An earlier write failed; the chunk was never queued
+                membudget.BUDGET.release(CHUNK_SIZE)
+                raise
+            bytes_downloaded += len(chunk)
+            if progress_callback:
+                if total_size_in_bytes:
+                    percentage = (bytes_downloaded / total_size_in_bytes) * 100
+                    progress_callback(bytes_downloaded, total_size_in_bytes, percentage)
+                else:
+                    progress_callback(bytes_downloaded, None, None)
+            if prof is not None:
+                prof.record_chunk(len(chunk), read_ns, time.perf_counter_ns() - loop_start)
+    finally:
+        # Everything received must be on disk before the caller looks at f.tell() to resume.
+        writer.close()
+
+def _candidate_urls(urls: list[str], app_name: str, cache_proxy: str | None, cancel_event=None):
+    """
+    Yields (url, timeout) pairs to try in order: the cache proxy first, then the
+    mirrors fastest first.
+    """
+    if cache_proxy:
+        # The full list is sent: the proxy caches per mirror list and may fetch from any of them.
+        yield f"{cache_proxy.rstrip('/')}/fetch?{urlencode([('url', u) for u in urls])}", PROXY_TIMEOUT
+    # Mirrors are only probed if the proxy could not serve the file.
+    if len(urls) > 1:
+        print(f"Probing {len(urls)} mirrors for {app_name}...")
+        with profiler.phase("probe"):
+            urls = mirrors.rank_mirrors(urls, cancel_event)
+    for url in urls:
+        yield url, TIMEOUT
+
+def download_file(url: str | list[str], dest_folder: str, app_name: str, progress_callback=None,
+                  session=None, cancel_event=None, cache_proxy: str | None = None, throttle=None):
     """
     Downloads a file from a URL to a specified destination folder.
     The downloaded file will be named after the app_name.
 
+    When a list of mirror URLs is given, the mirrors are probed and tried fastest
+    first. If a mirror fails mid-download, the next one resumes from the current
+    offset.
+
     Args:
-        url (str): The URL to download the file from.
+        url (str | list[str]): The URL, or list of mirror URLs, to download the file from.
         dest_folder (str): The folder to save the downloaded file in.
         app_name (str): The name of the application, used for the filename.
         progress_callback (function, optional): A callback function to report progress.
             It should accept three arguments: bytes_downloaded, total_size, percentage.
             total_size might be None if Content-Length is not available.
+        session (requests.Session, optional): Session to reuse pooled connections from.
+        cancel_event (threading.Event, optional): When set, the download stops and the
+            partial file is removed.
+        cache_proxy (str, optional): Base URL of a noox cache proxy to try first.
+            Defaults to CACHE_PROXY; pass an empty string to go straight upstream.
+        throttle (function, optional): Called before each chunk is read. It may block
+            to slow this transfer down, e.g. to leave bandwidth to more urgent jobs.
 
     Returns:
         bool: True if download was successful, False otherwise.
     """
-    if not url or not dest_folder or not app_name:
+    urls = [url] if isinstance(url, str) else list(url or [])
+    if not urls or not all(urls) or not dest_folder or not app_name:
         print("Error: URL, destination folder, and app name must be provided.")
         return False
 
@@ -33,49 +265,53 @@ def download_file(url: str, dest_folder: str, app_name: str, progress_callback=N
         return False
 
     file_path = os.path.join(dest_folder, app_name)
+    if cache_proxy is None:
+        cache_proxy = CACHE_PROXY
 
     try:
-        print(f"Starting download: {app_name} from {url} to {file_path}")
-        with requests.get(url, stream=True, timeout=10) as r:
-            r.raise_for_status()
-
-            total_size_in_bytes_str = r.headers.get('content-length')
-            total_size_in_bytes = None
-            if total_size_in_bytes_str:
-                total_size_in_bytes = int(total_size_in_bytes_str)
-                if progress_callback:
-                    progress_callback(0, total_size_in_bytes, 0)
-            else:
-                print("Warning: Content-Length header not found. Progress percentage will not be available.")
-                if progress_callback:
-                     progress_callback(0, None, None)
-
-            bytes_downloaded = 0
-            with open(file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        bytes_downloaded += len(chunk)
-                        if progress_callback:
-                            if total_size_in_bytes:
-                                percentage = (bytes_downloaded / total_size_in_bytes) * 100
-                                progress_callback(bytes_downloaded, total_size_in_bytes, percentage)
-                            else:
-                                progress_callback(bytes_downloaded, None, None)
-
-        print(f"Successfully downloaded {app_name} to {file_path}")
-        if total_size_in_bytes and bytes_downloaded != total_size_in_bytes:
-            print(f"Warning: Downloaded size {bytes_downloaded} does not match Content-Length {total_size_in_bytes}.")
-
-        if progress_callback:
-            if total_size_in_bytes:
-                 progress_callback(total_size_in_bytes, total_size_in_bytes, 100)
-            else: # Final call even if total_size was unknown
-                 progress_callback(bytes_downloaded, None, None)
+        transfer = {"total_size": None}
+        downloaded_from = None
+        attempts = 0
+        with open(file_path, 'wb') as f:
+            for mirror_url, timeout in _candidate_urls(urls, app_name, cache_proxy, cancel_event):
+                _check_cancelled(cancel_event) # Also covers cancels during mirror probing
+                attempts += 1
+                if f.tell():
+                    print(f"Failing over to {mirror_url}, resuming at byte {f.tell()}")
+                print(f"Starting download: {app_name} from {mirror_url} to {file_path}")
+                try:
+                    with profiler.phase("transfer"):
+                        _stream_from_mirror(mirror_url, f, transfer, progress_callback,
+                                            session=session, cancel_event=cancel_event, throttle=throttle,
+                                            timeout=timeout)
+                    downloaded_from = mirror_url
+                    break
+                except requests.exceptions.RequestException as e:
+                    print(f"Error downloading {app_name} from {mirror_url}: {e}")
+            bytes_downloaded = f.tell()
+        total_size_in_bytes = transfer["total_size"]
+
+        if downloaded_from is None:
+            if attempts > 1:
+                print(f"All {attempts} sources failed for {app_name}.")
+            os.remove(file_path) # Don't leave a truncated file behind
+            return False
+
+        with profiler.phase("post-process"):
+            print(f"Successfully downloaded {app_name} to {file_path}")
+            if total_size_in_bytes and bytes_downloaded != total_size_in_bytes:
+                print(f"Warning: Downloaded size {bytes_downloaded} does not match Content-Length {total_size_in_bytes}.")
+
+            if progress_callback:
+                if total_size_in_bytes:
+                     progress_callback(total_size_in_bytes, total_size_in_bytes, 100)
+                else: # Final call even if total_size was unknown
+                     progress_callback(bytes_downloaded, None, None)
 
         return True
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading {app_name} from {url}: {e}")
+    except DownloadCancelled:
+        print(f"Download of {app_name} cancelled.")
+        os.remove(file_path)
     except IOError as e:
         print(f"Error writing file {file_path}: {e}")
     except Exception as e:
@@ -84,8 +320,127 @@ def download_file(url: str, dest_folder: str, app_name: str, progress_callback=N
     return False
 
 if __name__ == '__main__':
+    import tempfile
+
     print("Testing downloader.py directly...")
 
+    # --- Offline checks: Content-Range validation, resume and failover ---
+    # Fake mirrors stand in for the network: FakeSession.get() answers like a server
+    # that serves `body`, optionally ignoring Range, answering from the wrong offset,
+    # or dropping the connection after a number of chunks.
+    class FakeResponse:
+        def __init__(self, status_code, headers, body, fail_after=None):
+            self.status_code, self.headers, self.body, self.fail_after = status_code, headers, body, fail_after
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size):
+            for i, start in enumerate(range(0, len(self.body), chunk_size)):
+                if self.fail_after is not None and i == self.fail_after:
+                    raise requests.exceptions.ConnectionError("Connection reset by fake mirror")
+                yield self.body[start:start + chunk_size]
+
+    class FakeMirror:
+        def __init__(self, body, ignore_range=False, wrong_offset=False, fail_after=None):
+            self.body, self.ignore_range, self.wrong_offset, self.fail_after = body, ignore_range, wrong_offset, fail_after
+            self.ranges = [] # Range header of every request received
+
+        def respond(self, range_header):
+            self.ranges.append(range_header)
+            if range_header is None or self.ignore_range:
+                return FakeResponse(200, {'content-length': str(len(self.body))}, self.body, self.fail_after)
+            start = 0 if self.wrong_offset else int(re.match(r'bytes=(\d+)-', range_header).group(1))
+            return FakeResponse(206, {'content-range': f'bytes {start}-{len(self.body) - 1}/{len(self.body)}'},
+                                self.body[start:], self.fail_after)
+
+    class FakeSession:
+        def __init__(self, mirrors):
+            self.mirrors = mirrors
+
+        def get(self, url, stream=True, timeout=None, headers=None):
+            return self.mirrors[url].respond((headers or {}).get('Range'))
+
+    data = bytes(range(256)) * 200 # 51200 bytes, 6.25 chunks
+    offline_dir = tempfile.mkdtemp()
+
+    def resume_from(mirror, written, known_total=len(data)):
+        """Resumes a partial file holding data[:written] from `mirror`; returns the file and transfer state."""
+        path = os.path.join(offline_dir, "partial")
+        transfer = {"total_size": known_total}
+        with open(path, 'wb') as f:
+            f.write(data[:written])
+            _stream_from_mirror("http://mirror/file", f, transfer, session=FakeSession({"http://mirror/file": mirror}))
+        with open(path, 'rb') as f:
+            return f.read(), transfer
+
+    # Test 1: Content-Range parsing
+    for header, expected in [("bytes 100-199/1000", (100, 1000)), ("bytes 0-9/*", (0, None)),
+                             (" bytes 5-5/6 ", (5, 6)), ("bytes */1000", None), ("bytes=0-9/10", None), (None, None)]:
+        result = _parse_content_range(header)
+        print(f"_parse_content_range({header!r}) -> {result}")
+        assert result == expected
+
+    # Test 2: A matching 206 continues the partial file
+    mirror = FakeMirror(data)
+    content, transfer = resume_from(mirror, 20000)
+    print(f"Matching 206: requests {mirror.ranges}")
+    assert content == data and mirror.ranges == ["bytes=20000-"]
+
+    # Test 3: A 206 from the wrong offset restarts the download from the beginning
+    mirror = FakeMirror(data, wrong_offset=True)
+    content, transfer = resume_from(mirror, 20000)
+    print(f"Wrong-offset 206: requests {mirror.ranges}")
+    assert content == data and mirror.ranges == ["bytes=20000-", None]
+
+    # Test 4: A 206 for a file of another size (another build) restarts with that file
+    other = data + b"other build"
+    mirror = FakeMirror(other)
+    content, transfer = resume_from(mirror, 20000)
+    print(f"Different total: requests {mirror.ranges}, total now {transfer['total_size']}")
+    assert content == other and transfer["total_size"] == len(other) and mirror.ranges == ["bytes=20000-", None]
+
+    # Test 5: A 200 on resume (Range ignored) truncates and rewrites the whole file
+    mirror = FakeMirror(data, ignore_range=True)
+    content, transfer = resume_from(mirror, 20000)
+    print(f"200 on resume: requests {mirror.ranges}")
+    assert content == data and transfer["total_size"] == len(data) and mirror.ranges == ["bytes=20000-"]
+
+    # Test 6: A mirror failing mid-transfer fails over and the next mirror resumes at the offset.
+    # Port 9 (discard) refuses connections, so probing finds no reachable mirror and keeps the order.
+    flaky, good = FakeMirror(data, fail_after=3), FakeMirror(data)
+    urls = ["http://127.0.0.1:9/flaky", "http://127.0.0.1:9/good"]
+    session = FakeSession(dict(zip(urls, [flaky, good])))
+    assert download_file(urls, offline_dir, "failover", session=session, cache_proxy="")
+    with open(os.path.join(offline_dir, "failover"), 'rb') as f:
+        assert f.read() == data
+    print(f"Failover: flaky {flaky.ranges}, good {good.ranges}")
+    assert good.ranges == [f"bytes={3 * CHUNK_SIZE}-"]
+
+    # Test 7: A failing disk surfaces as an error and gives back every budget reservation
+    class FullDisk:
+        def tell(self):
+            return 0
+
+        def write(self, chunk):
+            raise OSError(28, "No space left on device")
+    try:
+        # The throttle slows the reader so the write error is seen while queuing the next chunk.
+        _stream_from_mirror("http://mirror/file", FullDisk(), {"total_size": None},
+                            session=FakeSession({"http://mirror/file": FakeMirror(data)}),
+                            throttle=lambda: time.sleep(0.01))
+        raise AssertionError("Write error was swallowed")
+    except OSError as e:
+        print(f"Full disk: {e}; budget in use afterwards: {membudget.BUDGET.in_use}")
+    assert membudget.BUDGET.in_use == 0
+    print("\nAll offline downloader tests passed.\n")
+
     def my_test_callback(bytes_down, total_bytes, percent):
         if total_bytes and percent is not None:
             print(f"Downloaded: {bytes_down}/{total_bytes} bytes ({percent:.2f}%)")
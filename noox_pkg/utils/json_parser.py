@@ -1,15 +1,38 @@
 import json
 import os
 
+from .scheduler import PRIORITIES
+
 def load_apps_from_json(filepath: str) -> dict | None:
     """
     Loads application names and URLs from a JSON file.
 
+    Each app maps to either a single URL string or a list of mirror URLs.
+
+    Args:
+        filepath: Path to the JSON file.
+
+    Returns:
+        A dictionary of {app_name: url_or_mirror_list} if successful, None otherwise.
+    """
+    manifest = load_manifest(filepath)
+    return manifest[0] if manifest is not None else None
+
+def load_manifest(filepath: str) -> tuple[dict, dict] | None:
+    """
+    Loads application URLs and scheduling options from a JSON file.
+
+    An app's value is a URL string, a list of mirror URLs, or an object:
+        {"url": <url or mirror list>, "priority": "high", "deadline": 60, "size": 1048576}
+    where priority is one of PRIORITIES, deadline is seconds after the download is
+    submitted, and size is the expected size in bytes. All keys but "url" are optional.
+
     Args:
         filepath: Path to the JSON file.
 
     Returns:
-        A dictionary of {app_name: url} if successful, None otherwise.
+        A tuple ({app_name: url_or_mirror_list}, {app_name: options}) if successful,
+        None otherwise. Only apps with options appear in the second dictionary.
     """
     if not os.path.exists(filepath):
         print(f"Error: JSON file not found at {filepath}")
@@ -35,6 +58,7 @@ def load_apps_from_json(filepath: str) -> dict | None:
         return None
 
     validated_apps = {}
+    app_options = {}
     for key, value in data.items():
         if not isinstance(key, str):
             print(f"Error: App name (JSON key) must be a string. Found: {key} (type: {type(key).__name__})")
@@ -42,18 +66,59 @@ def load_apps_from_json(filepath: str) -> dict | None:
 
         app_name = key
 
-        if not isinstance(value, str):
-            print(f"Error: App URL (JSON value) must be a string for app '{app_name}'. Found: {value} (type: {type(value).__name__})")
-            return None
+        if isinstance(value, dict):
+            options = _validate_options(app_name, value)
+            if options is None:
+                return None
+            if options:
+                app_options[app_name] = options
+            value = value.get("url")
+
+        # A value is either a single URL or a list of mirror URLs for the same file.
+        if isinstance(value, list):
+            if not value:
+                print(f"Error: Mirror list for app '{app_name}' must not be empty.")
+                return None
+            urls = value
+        else:
+            urls = [value]
 
-        url = value
+        for url in urls:
+            if not isinstance(url, str):
+                print(f"Error: App URL (JSON value) must be a string or a list of strings for app '{app_name}'. Found: {url} (type: {type(url).__name__})")
+                return None
 
-        if not (url.startswith('http://') or url.startswith('https://')):
-            print(f"Warning: URL for app '{app_name}' does not look valid: {url}")
+            if not (url.startswith('http://') or url.startswith('https://')):
+                print(f"Warning: URL for app '{app_name}' does not look valid: {url}")
 
-        validated_apps[app_name] = url
+        validated_apps[app_name] = value
 
-    return validated_apps
+    return validated_apps, app_options
+
+def _validate_options(app_name: str, entry: dict) -> dict | None:
+    """Validates the scheduling options of an object-form entry. Returns None on error."""
+    unknown = set(entry) - {"url", "priority", "deadline", "size"}
+    if unknown:
+        print(f"Error: Unknown keys for app '{app_name}': {', '.join(sorted(unknown))}")
+        return None
+    if "url" not in entry:
+        print(f"Error: App '{app_name}' must have a 'url'.")
+        return None
+
+    options = {}
+    if "priority" in entry:
+        if entry["priority"] not in PRIORITIES:
+            print(f"Error: Priority for app '{app_name}' must be one of {', '.join(PRIORITIES)}. Found: {entry['priority']}")
+            return None
+        options["priority"] = entry["priority"]
+    for option in ("deadline", "size"):
+        if option in entry:
+            number = entry[option]
+            if isinstance(number, bool) or not isinstance(number, (int, float)) or number < 0:
+                print(f"Error: '{option}' for app '{app_name}' must be a non-negative number. Found: {number}")
+                return None
+            options[option] = number
+    return options
 
 if __name__ == '__main__':
     # --- Test Cases ---
@@ -153,13 +218,56 @@ if __name__ == '__main__':
     assert "AppNameFtp" in result
     assert "AppNameNoScheme" in result
 
-    # Test 8: Empty JSON file
+    # Test 8: Mirror lists
+    create_test_file("test_mirrors.json", '''
+{
+  "AppWithMirrors": ["https://mirror1.example.com/app.zip", "https://mirror2.example.com/app.zip"],
+  "AppEmptyMirrors": []
+}
+    ''')
+    result = load_apps_from_json("test_mirrors.json")
+    print(f"Result for test_mirrors.json: {result}")
+    assert result is None # Empty mirror list is rejected
+
+    create_test_file("test_mirrors.json", '''
+{
+  "AppWithMirrors": ["https://mirror1.example.com/app.zip", "https://mirror2.example.com/app.zip"]
+}
+    ''')
+    result = load_apps_from_json("test_mirrors.json")
+    assert result is not None
+    assert result["AppWithMirrors"][1] == "https://mirror2.example.com/app.zip"
+
+    # Test 9: Entries with scheduling options
+    create_test_file("test_options.json", '''
+{
+  "Urgent": {"url": "https://example.com/tool.exe", "priority": "critical", "deadline": 30, "size": 1024},
+  "Bulk": {"url": ["https://a.example.com/big.iso", "https://b.example.com/big.iso"], "priority": "low"},
+  "Plain": "https://example.com/plain.zip"
+}
+    ''')
+    manifest = load_manifest("test_options.json")
+    assert manifest is not None
+    apps, options = manifest
+    assert apps["Urgent"] == "https://example.com/tool.exe"
+    assert options["Urgent"] == {"priority": "critical", "deadline": 30, "size": 1024}
+    assert len(apps["Bulk"]) == 2 and options["Bulk"]["priority"] == "low"
+    assert "Plain" not in options
+
+    create_test_file("test_options.json", '''
+{
+  "BadPriority": {"url": "https://example.com/tool.exe", "priority": "asap"}
+}
+    ''')
+    assert load_manifest("test_options.json") is None
+
+    # Test 10: Empty JSON file
     create_test_file("test_empty.json", "")
     result = load_apps_from_json("test_empty.json")
     print(f"Result for test_empty.json: {result}")
     assert result is None
 
-    # Test 9: JSON file with only whitespace
+    # Test 11: JSON file with only whitespace
     create_test_file("test_whitespace.json", "   \n\t   ")
     result = load_apps_from_json("test_whitespace.json")
     print(f"Result for test_whitespace.json: {result}")
@@ -174,6 +282,8 @@ if __name__ == '__main__':
     # os.remove("test_invalid_key.json") # File not created as test is skipped
     os.remove("test_invalid_value.json")
     os.remove("test_bad_url_format.json")
+    os.remove("test_mirrors.json")
+    os.remove("test_options.json")
     os.remove("test_empty.json")
     os.remove("test_whitespace.json")
     print("Cleaned up test files.")
@@ -0,0 +1,133 @@
+import sys
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+class MemoryBudget:
+    """
+    Bounds the bytes held in transfer buffers across all threads.
+
+    Readers reserve room for a chunk before pulling it off the socket and release it
+    once the chunk is written. When the budget is exhausted, reserve() blocks, which
+    stops further socket reads until the writers catch up.
+    """
+
+    def __init__(self, limit_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.limit_bytes = limit_bytes
+        self.in_use = 0
+        self.peak_in_use = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit_bytes: int):
+        with self._cond:
+            self.limit_bytes = limit_bytes
+            self._cond.notify_all()
+
+    def acquire(self, n: int):
+        with self._cond:
+            # A request larger than the whole budget is let through once nothing else is
+            # buffered, otherwise it would wait forever.
+            while self.in_use and self.in_use + n > self.limit_bytes:
+                self._cond.wait()
+            self.in_use += n
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def release(self, n: int):
+        with self._cond:
+            self.in_use -= n
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, n: int):
+        self.acquire(n)
+        try:
+            yield
+        finally:
+            self.release(n)
+
+# Shared by every download path in the process (CLI, GUI threads, daemon, cache proxy).
+BUDGET = MemoryBudget()
+
+def peak_rss_bytes() -> int | None:
+    """Returns the peak resident set size of this process, or None if unavailable."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return _peak_working_set_windows()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports KiB, macOS bytes
+
+def _peak_working_set_windows() -> int | None:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        return None
+
+def memory_summary() -> str:
+    """One-line memory report for run summaries."""
+    peak_rss = peak_rss_bytes()
+    rss = f"{peak_rss / (1024 * 1024):.1f} MB" if peak_rss is not None else "unavailable"
+    return (f"Peak memory: {rss} RSS; transfer buffers peaked at {BUDGET.peak_in_use // 1024}KB "
+            f"of a {BUDGET.limit_bytes // (1024 * 1024)} MB budget.")
+
+if __name__ == '__main__':
+    import time
+
+    # --- Test Cases ---
+    # Test 1: Reservations are counted and released, and the peak is kept
+    budget = MemoryBudget(100)
+    with budget.reserve(60):
+        assert budget.in_use == 60
+    print(f"After reserve: in_use={budget.in_use}, peak={budget.peak_in_use}")
+    assert budget.in_use == 0 and budget.peak_in_use == 60
+
+    # Test 2: acquire() blocks while the budget is used up, until another thread releases
+    budget.acquire(80)
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (budget.acquire(40), acquired.set()))
+    waiter.start()
+    time.sleep(0.05)
+    print(f"Second acquire blocked while 80/100 in use: {not acquired.is_set()}")
+    assert not acquired.is_set()
+    budget.release(80)
+    waiter.join(timeout=1)
+    assert acquired.is_set() and budget.in_use == 40 and budget.peak_in_use == 80
+    budget.release(40)
+
+    # Test 3: A request larger than the whole budget goes through when nothing else is buffered
+    budget.acquire(150)
+    print(f"Oversize request: in_use={budget.in_use} of {budget.limit_bytes}")
+    assert budget.in_use == 150
+    budget.release(150)
+
+    # Test 4: Raising the limit wakes blocked threads
+    budget.acquire(90)
+    waiter = threading.Thread(target=budget.acquire, args=(20,))
+    waiter.start()
+    time.sleep(0.05)
+    assert waiter.is_alive()
+    budget.set_limit(200)
+    waiter.join(timeout=1)
+    assert not waiter.is_alive() and budget.in_use == 110
+
+    # Test 5: The summary reports the global budget
+    summary = memory_summary()
+    print(summary)
+    assert summary.startswith("Peak memory:") and f"{DEFAULT_BUDGET_BYTES // (1024 * 1024)} MB budget" in summary
+    print("\nAll membudget tests passed.")
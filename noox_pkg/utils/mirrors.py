@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from . import profiler
+
+# Number of bytes fetched from each mirror when probing. Small enough to be cheap,
+# large enough that the result reflects throughput and not only connection latency.
+PROBE_BYTES = 64 * 1024
+PROBE_TIMEOUT = 5
+
+def probe_mirror(url: str, probe_bytes: int = PROBE_BYTES, timeout: float = PROBE_TIMEOUT) -> float | None:
+    """
+    Measures how long a mirror takes to serve the first bytes of a file.
+
+    Args:
+        url (str): The mirror URL to probe.
+        probe_bytes (int): How many bytes to fetch before stopping the probe.
+        timeout (float): Connection/read timeout for the probe in seconds.
+
+    Returns:
+        float | None: Elapsed seconds to receive the probe bytes (latency plus transfer),
+        or None if the mirror could not be reached.
+    """
+    start = time.perf_counter()
+    try:
+        headers = {'Range': f'bytes=0-{probe_bytes - 1}'}
+        with requests.get(url, stream=True, timeout=timeout, headers=headers) as r:
+            r.raise_for_status()
+            received = 0
+            for chunk in r.iter_content(chunk_size=8192):
+                received += len(chunk)
+                if received >= probe_bytes:
+                    break
+    except requests.exceptions.RequestException as e:
+        print(f"Mirror probe failed for {url}: {e}")
+        return None
+    return time.perf_counter() - start
+
+def _profiled_probe(url: str) -> float | None:
+    with profiler.phase("probe"): # Runs in a pool thread, outside the caller's phase
+        return probe_mirror(url)
+
+def rank_mirrors(urls: list[str], cancel_event=None) -> list[str]:
+    """
+    Orders mirrors from fastest to slowest based on a short probe of each one.
+
+    Mirrors are probed concurrently. Unreachable mirrors are kept at the end of the
+    list, in their original order, so they can still be used as a last resort.
+
+    Args:
+        urls (list[str]): Mirror URLs for the same file.
+        cancel_event (threading.Event, optional): When set, stops waiting for the probes
+            and returns the URLs in their original order.
+
+    Returns:
+        list[str]: The same URLs, fastest first.
+    """
+    if len(urls) < 2:
+        return list(urls)
+
+    pool = ThreadPoolExecutor(max_workers=len(urls))
+    futures = [pool.submit(_profiled_probe, url) for url in urls]
+    pending = futures
+    while pending:
+        if cancel_event is not None and cancel_event.is_set():
+            pool.shutdown(wait=False) # Probes time out on their own
+            return list(urls)
+        _, pending = wait(pending, timeout=0.1)
+    pool.shutdown()
+    timings = [future.result() for future in futures]
+
+    reachable = sorted((t, i) for i, t in enumerate(timings) if t is not None)
+    unreachable = [i for i, t in enumerate(timings) if t is None]
+    ranked = [urls[i] for _, i in reachable] + [urls[i] for i in unreachable]
+
+    for t, i in reachable:
+        print(f"Mirror {urls[i]} responded in {t * 1000:.0f} ms")
+    return ranked
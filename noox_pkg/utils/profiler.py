@@ -0,0 +1,179 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+SAMPLE_INTERVAL = 0.005 # Seconds between stack samples
+
+# Before 3.12, cProfile only hooks the thread that enables it, so each thread gets its
+# own profile per phase and they are merged when profiling stops. From 3.12 it is built
+# on sys.monitoring: one profile sees every thread, but only one can be active at a time.
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+# The profiler for this process, if --profile was given. Code on the hot paths checks
+# this once and does no extra work when it is None.
+ACTIVE = None
+
+class Profiler:
+    """
+    Profiles the download and import hot paths, split into phases.
+
+    Two views are recorded:
+      * A cProfile per phase (import, probe, transfer, write, post-process), merged across
+        threads, written as <phase>.prof files loadable with pstats or snakeviz. On
+        Python 3.12+ this is a single process.prof covering the whole run instead.
+      * Sampled stacks from every thread currently inside a phase, written as
+        flamegraph-compatible collapsed stacks ("phase;frame;frame count").
+
+    The download chunk loop additionally reports its per-chunk cost via record_chunk().
+    """
+
+    def __init__(self, output_dir: str, sample_interval: float = SAMPLE_INTERVAL):
+        self.output_dir = os.path.abspath(output_dir)
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.phase_profiles = {} # (thread ident, phase) -> cProfile.Profile
+        self.process_profile = None if PER_THREAD_PROFILES else cProfile.Profile()
+        self.phase_times = Counter() # ns per phase, summed over every thread that entered it
+        self.started_ns = None
+        self.samples = Counter()
+        self._thread_phases = {} # Thread ident -> stack of active phase names
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="noox-profiler", daemon=True)
+        self.chunks = 0
+        self.chunk_bytes = 0
+        self.read_ns = 0
+        self.loop_ns = 0
+
+    def start(self):
+        self.started_ns = time.perf_counter_ns()
+        if self.process_profile is not None:
+            self.process_profile.enable()
+        self._sampler.start()
+
+    @contextmanager
+    def phase(self, name: str):
+        ident = threading.get_ident()
+        with self.lock:
+            stack = self._thread_phases.setdefault(ident, [])
+            parent = stack[-1] if stack else None
+            stack.append(name)
+            profile = parent_profile = None
+            if PER_THREAD_PROFILES:
+                profile = self.phase_profiles.setdefault((ident, name), cProfile.Profile())
+                parent_profile = self.phase_profiles.get((ident, parent))
+        if profile is not None:
+            if parent_profile is not None:
+                parent_profile.disable()
+            profile.enable()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            if profile is not None:
+                profile.disable()
+                if parent_profile is not None:
+                    parent_profile.enable()
+            with self.lock:
+                self.phase_times[name] += elapsed
+                stack.pop()
+                if not stack:
+                    del self._thread_phases[ident]
+
+    def record_chunk(self, nbytes: int, read_ns: int, loop_ns: int):
+        """Records the cost of one iteration of the download chunk loop."""
+        with self.lock:
+            self.chunks += 1
+            self.chunk_bytes += nbytes
+            self.read_ns += read_ns
+            self.loop_ns += loop_ns
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self.lock:
+                active = [(ident, stack[-1]) for ident, stack in self._thread_phases.items()]
+            for ident, phase in active:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                    frame = frame.f_back
+                names.append(phase)
+                self.samples[";".join(reversed(names))] += 1
+
+    def stop(self):
+        """Stops sampling, writes the profile files and prints a summary."""
+        self._stop.set()
+        self._sampler.join()
+        if self.process_profile is not None:
+            self.process_profile.disable()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if self.process_profile is not None:
+                self.process_profile.dump_stats(os.path.join(self.output_dir, "process.prof"))
+            for name, stats in self._merged_phase_stats().items():
+                stats.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+            with open(os.path.join(self.output_dir, "stacks.collapsed"), 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(os.path.join(self.output_dir, "summary.txt"), 'w') as f:
+                f.write(self.summary() + "\n")
+        except OSError as e:
+            print(f"Error writing profile to {self.output_dir}: {e}")
+            return
+        print(self.summary())
+        print(f"Profile written to {self.output_dir}")
+
+    def _merged_phase_stats(self) -> dict:
+        merged = {}
+        for (_, name), profile in self.phase_profiles.items():
+            try:
+                if name in merged:
+                    merged[name].add(profile)
+                else:
+                    merged[name] = pstats.Stats(profile)
+            except TypeError:
+                pass # pstats rejects a profile that recorded no calls
+        return merged
+
+    def summary(self) -> str:
+        lines = [f"Profile summary ({(time.perf_counter_ns() - self.started_ns) / 1e6:.1f} ms wall clock):"]
+        # Phases run in several threads at once (downloads, mirror probes, disk writers),
+        # so their totals are thread time and can add up to more than the wall clock.
+        for name, ns in self.phase_times.items():
+            lines.append(f"  {name}: {ns / 1e6:.1f} ms thread time")
+        if self.chunk_bytes:
+            overhead_ns = self.loop_ns - self.read_ns
+            lines.append(f"  chunk loop: {self.chunks} chunks, {self.chunk_bytes} bytes, "
+                         f"{self.loop_ns / self.chunk_bytes:.2f} ns/byte total "
+                         f"(read {self.read_ns / self.chunk_bytes:.2f}, "
+                         f"budget wait and loop overhead {overhead_ns / self.chunk_bytes:.2f}); "
+                         f"disk writes {self.phase_times['write'] / self.chunk_bytes:.2f} ns/byte")
+        lines.append(f"  {sum(self.samples.values())} stack samples")
+        return "\n".join(lines)
+
+def start(output_dir: str) -> Profiler:
+    """Starts profiling this process and makes the profiler ACTIVE."""
+    global ACTIVE
+    ACTIVE = Profiler(output_dir)
+    ACTIVE.start()
+    return ACTIVE
+
+def stop():
+    global ACTIVE
+    if ACTIVE is not None:
+        ACTIVE.stop()
+        ACTIVE = None
+
+def phase(name: str):
+    """Context manager marking a profiling phase. Does nothing unless profiling is active."""
+    return ACTIVE.phase(name) if ACTIVE is not None else nullcontext()
@@ -0,0 +1,213 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+
+PRIORITIES = ("critical", "high", "normal", "low") # Most urgent first
+DEFAULT_PRIORITY = "normal"
+
+# While a more urgent transfer is running, less urgent ones pause this long before each
+# chunk. They keep making progress, but most of the bandwidth goes to the urgent job.
+URGENT_PAUSE = 0.02
+
+def job_sort_key(job: dict) -> tuple:
+    """
+    Orders jobs by priority class, then earliest deadline, then smallest known size.
+
+    Jobs without a deadline or size sort after those that have one within their class.
+    """
+    deadline_at = job.get("deadline_at")
+    size = job.get("size")
+    return (PRIORITIES.index(job.get("priority", DEFAULT_PRIORITY)),
+            deadline_at if deadline_at is not None else math.inf,
+            size if size is not None else math.inf)
+
+def outranks(priority: str, other: str) -> bool:
+    """True if `priority` is a more urgent class than `other`."""
+    return PRIORITIES.index(priority) < PRIORITIES.index(other)
+
+def make_throttle(running: Counter, priority: str):
+    """
+    Returns a per-chunk hook that pauses a transfer while a more urgent one runs.
+
+    Args:
+        running: Priority class -> number of running transfers, kept up to date by the caller.
+        priority: Priority class of the transfer being throttled.
+    """
+    more_urgent = PRIORITIES[:PRIORITIES.index(priority)]
+
+    def throttle():
+        if any(running[p] for p in more_urgent):
+            time.sleep(URGENT_PAUSE)
+    return throttle
+
+def make_job(app_name: str, url, options: dict | None = None, priority: str | None = None) -> dict:
+    """
+    Builds a download job from a manifest entry.
+
+    Args:
+        app_name: Name of the application.
+        url: URL or list of mirror URLs.
+        options: Scheduling options from the manifest (priority, deadline, size).
+        priority: Overrides the manifest priority, e.g. from --priority.
+    """
+    options = options or {}
+    deadline = options.get("deadline")
+    return {
+        "app_name": app_name, "url": url,
+        "priority": priority or options.get("priority", DEFAULT_PRIORITY),
+        # Wall clock, so deadlines survive being persisted (see daemon.py).
+        "deadline_at": time.time() + deadline if deadline is not None else None,
+        "size": options.get("size"),
+    }
+
+class PriorityScheduler:
+    """
+    Runs download jobs with a pool of worker threads, most urgent first.
+
+    Less urgent transfers yield bandwidth while a more urgent one is running (see
+    throttle_for), and the first job to finish in each priority class is recorded
+    for the run report.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count() # Keeps submission order among equal keys
+        self._running = Counter() # Priority class -> running transfers
+        self.started_at = None
+        self.first_ready = {} # Priority class -> seconds from start to first success
+        self.totals = Counter()
+        self.succeeded = Counter()
+        self.missed_deadlines = Counter()
+
+    def submit(self, job: dict):
+        with self.lock:
+            heapq.heappush(self._heap, (job_sort_key(job), next(self._seq), job))
+            self.totals[job["priority"]] += 1
+
+    def throttle_for(self, priority: str):
+        """Returns a per-chunk hook that slows a transfer while a more urgent one runs."""
+        return make_throttle(self._running, priority)
+
+    def run(self, download) -> bool:
+        """
+        Runs all submitted jobs.
+
+        Args:
+            download: Callable taking (job, throttle) and returning True on success.
+
+        Returns:
+            bool: True if every job succeeded.
+        """
+        self.started_at = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(download,), daemon=True)
+                   for _ in range(min(self.workers, len(self._heap)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(self.succeeded.values()) == sum(self.totals.values())
+
+    def _worker(self, download):
+        while True:
+            with self.lock:
+                if not self._heap:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                self._running[job["priority"]] += 1
+            try:
+                success = download(job, self.throttle_for(job["priority"]))
+            except Exception as e:
+                print(f"Unexpected error downloading {job['app_name']}: {e}")
+                success = False
+            finished = time.perf_counter()
+            with self.lock:
+                self._running[job["priority"]] -= 1
+                if success:
+                    self.succeeded[job["priority"]] += 1
+                    self.first_ready.setdefault(job["priority"], finished - self.started_at)
+                if job["deadline_at"] is not None and time.time() > job["deadline_at"]:
+                    self.missed_deadlines[job["priority"]] += 1
+
+    def report(self) -> str:
+        lines = ["Priority report:"]
+        for priority in PRIORITIES:
+            if not self.totals[priority]:
+                continue
+            first = self.first_ready.get(priority)
+            first_str = f"{first:.2f}s" if first is not None else "never"
+            line = (f"  {priority}: {self.succeeded[priority]}/{self.totals[priority]} succeeded, "
+                    f"first ready after {first_str}")
+            if self.missed_deadlines[priority]:
+                line += f", {self.missed_deadlines[priority]} missed deadline"
+            lines.append(line)
+        return "\n".join(lines)
+
+if __name__ == '__main__':
+    # --- Test Cases ---
+    # Test 1: Priority class first, then earliest deadline, then smallest size
+    jobs = [
+        {"app_name": "low", "priority": "low", "deadline_at": 1, "size": 1},
+        {"app_name": "normal-big", "priority": "normal", "deadline_at": None, "size": 500},
+        {"app_name": "normal-unsized", "priority": "normal", "deadline_at": None, "size": None},
+        {"app_name": "normal-small", "priority": "normal", "deadline_at": None, "size": 10},
+        {"app_name": "normal-late", "priority": "normal", "deadline_at": 200, "size": 1000},
+        {"app_name": "normal-soon", "priority": "normal", "deadline_at": 100, "size": 1000},
+        {"app_name": "critical", "priority": "critical", "deadline_at": None, "size": None},
+        {"app_name": "default"}, # No priority given: normal, no deadline, no size
+    ]
+    order = [job["app_name"] for job in sorted(jobs, key=job_sort_key)]
+    print(f"Sorted jobs: {order}")
+    assert order == ["critical", "normal-soon", "normal-late", "normal-small", "normal-big",
+                     "normal-unsized", "default", "low"]
+
+    # Test 2: make_job turns a relative deadline into wall-clock time, and --priority wins
+    job = make_job("App", "http://example.com/app", {"priority": "low", "deadline": 60, "size": 5}, priority="high")
+    print(f"make_job result: {job}")
+    assert job["priority"] == "high" and job["size"] == 5
+    assert 0 < job["deadline_at"] - time.time() <= 60
+    assert make_job("App", "http://example.com/app")["priority"] == DEFAULT_PRIORITY
+
+    # Test 3: Scheduler runs the most urgent job first and reports per class
+    scheduler = PriorityScheduler(workers=1)
+    for name, priority, deadline_at in [("n1", "normal", None), ("c1", "critical", None),
+                                        ("l1", "low", time.time() - 1), ("n2", "normal", None)]:
+        scheduler.submit({"app_name": name, "priority": priority, "deadline_at": deadline_at, "size": None})
+    started = []
+
+    def fake_download(job, throttle):
+        started.append(job["app_name"])
+        time.sleep(0.01)
+        return job["app_name"] != "n2" # n2 fails
+    all_ok = scheduler.run(fake_download)
+    report = scheduler.report()
+    print(f"Start order: {started}\n{report}")
+    assert started == ["c1", "n1", "n2", "l1"]
+    assert not all_ok
+    assert scheduler.first_ready["critical"] < scheduler.first_ready["normal"] < scheduler.first_ready["low"]
+    assert "critical: 1/1 succeeded" in report
+    assert "normal: 1/2 succeeded" in report
+    assert "low: 1/1 succeeded" in report and "1 missed deadline" in report
+    assert "high" not in report # Classes without jobs are left out
+
+    # Test 4: A class that never succeeds is reported as never ready
+    scheduler = PriorityScheduler()
+    scheduler.submit(make_job("Broken", "http://example.com/broken", priority="high"))
+    assert scheduler.run(lambda job, throttle: False) is False
+    print(scheduler.report())
+    assert "high: 0/1 succeeded, first ready after never" in scheduler.report()
+
+    # Test 5: Throttle pauses less urgent transfers only while a more urgent one runs
+    scheduler = PriorityScheduler()
+    scheduler._running["critical"] = 1
+    start = time.perf_counter()
+    scheduler.throttle_for("critical")()
+    assert time.perf_counter() - start < URGENT_PAUSE
+    scheduler.throttle_for("low")()
+    assert time.perf_counter() - start >= URGENT_PAUSE
+    assert outranks("critical", "low") and not outranks("normal", "normal") and not outranks("low", "high")
+    print("\nAll scheduler tests passed.")